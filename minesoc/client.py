@@ -11,7 +11,8 @@ import discord
 from discord.ext.commands import Bot
 from libneko.aggregates import Proxy
 
-from minesoc.utils import logger, emojis, context, config, api, extras
+from minesoc.utils import logger, emojis, context, config, api, extras, xp, migrations, blacklist, persistence, \
+    dispatch, render, ranking, audio, minecraft
 
 
 class Minesoc(Bot):
@@ -31,15 +32,50 @@ class Minesoc(Bot):
         self.path = Path(".")
         self.api = api.API(self)
         self.sqlschema = extras.SQLSchema()
+        self.migrator = migrations.Migrator(self)
         self._emojis = emojis.CustomEmojis()
         self.colors = config.ColorProxy()
 
         self.xp_values = Proxy(min=3, max=5)
+        self.xp = xp.XPAccumulator(self)
+        self.leaderboards = ranking.Leaderboards(self, enabled=self.config.get("memory_leaderboards", False),
+                                                 max_members=self.config.get("leaderboard_max_members", 500000))
+        self.blacklist = blacklist.Blacklist(self)
+        self.persistence = persistence.PersistenceSettings(self)
+        self.pipeline = dispatch.MessagePipeline(self)
+        self.pipeline.add("commands", self.invoke_commands, priority=100)
+        self.searches = audio.SearchCache(self, maxsize=self.config.get("search_cache_size", 5000),
+                                          ttl=self.config.get("search_cache_ttl", 86400),
+                                          persist=self.config.get("search_cache_persist", False))
+        self.spotify_tracks = audio.SpotifyTrackMap(self, stale_after=self.config.get("spotify_track_stale_after",
+                                                                                       2592000))
+        self.minecraft = minecraft.MinecraftClient(nameserver=self.config.get("dns_server"),
+                                                   ttl=self.config.get("minecraft_cache_ttl", 30),
+                                                   allow_private=self.config.get("minecraft_allow_private", False))
+        self.watchlist = minecraft.Watchlist(self, self.minecraft, interval=self.config.get("watch_interval", 60))
+        self.render = render.RenderService(self, workers=self.config.get("render_workers", 2),
+                                           max_pending=self.config.get("render_queue", 16),
+                                           cache_bytes=self.config.get("card_cache_bytes", 32 * 1024 * 1024),
+                                           preload=self.config.get("preload_backgrounds", True))
 
         self.status = self.loop.create_task(self.change_status())
 
     async def start(self):
         await self.connect_to_database()
+        self.xp_flusher = self.loop.create_task(self.xp.run())
+        self.blacklist_reconciler = self.loop.create_task(self.blacklist.run())
+        await self.render.start()
+
+        try:
+            await self.searches.load()
+        except Exception as e:
+            self.logger.warning("Persisted search results could not be loaded.", exc_info=e)
+
+        try:
+            await self.watchlist.load()
+        except Exception as e:
+            self.logger.error("Minecraft watchlist could not be loaded.", exc_info=e)
+        self.watch_poller = self.loop.create_task(self.watchlist.run())
         self.load_modules()
         await self._start()
 
@@ -47,6 +83,13 @@ class Minesoc(Bot):
         await super().start(self.config.token)
 
     async def close(self):
+        try:
+            await self.xp.flush()
+        except Exception as e:
+            self.logger.error("Failed to flush XP on shutdown.", exc_info=e)
+
+        self.render.close()
+
         try:
             await self.db.close()
         finally:
@@ -58,21 +101,22 @@ class Minesoc(Bot):
     async def connect_to_database(self):
         try:
             self.db = await asyncpg.create_pool(**self.config.postgres)
-            await self.db.execute(self.sqlschema.read("schema.sql"))
             self.logger.info("Connected to database.")
+            applied = await self.migrator.run()
+            if applied:
+                self.logger.info(f"Applied database migrations: {', '.join(applied)}")
             await self.load_blacklist()
         except Exception as e:
             self.logger.warning("An error occurred connecting to the database", exc_info=e)
 
     async def load_blacklist(self):
         try:
-            self.user_blacklist = [u["id"] for u in (await self.db.fetch("SELECT id FROM user_blacklist"))]
-            self.guild_blacklist = [g["id"] for g in (await self.db.fetch("SELECT id FROM guild_blacklist"))]
+            await self.blacklist.load()
         except Exception as e:
             self.logger.error("Blacklist could not be loaded.", exc_info=e)
         else:
             self.logger.info(
-                f"Initialized blacklist. {len(self.guild_blacklist)} guilds and {len(self.user_blacklist)} users "
+                f"Initialized blacklist. {len(self.blacklist.guilds)} guilds and {len(self.blacklist.users)} users "
                 f"blacklisted.")
 
     def xp_gain(self):
@@ -90,19 +134,27 @@ class Minesoc(Bot):
             self.load_extension("jishaku")
 
     async def on_message(self, message):
-        author = message.author.id
-        user = await self.db.fetchrow("SELECT EXISTS(SELECT 1 FROM user_blacklist WHERE id=$1)", author)
-
-        if user[0]:
+        if message.author.id in self.blacklist.users:
             return
         else:
-            await self.process_commands(message)
+            await self.pipeline.dispatch(message)
+
+    async def invoke_commands(self, ctx):
+        if ctx.author.bot:
+            return
+
+        await self.invoke(ctx)
 
     async def on_ready(self):
         self.dev_guild = self.get_guild(int(self.config.dev_guild))
         self._emojis.fetch_emojis(self.dev_guild)
         self._owner = self.get_user(self.owner_id)
 
+        try:
+            await self.persistence.provision(g.id for g in self.guilds)
+        except Exception as e:
+            self.logger.error("Persistence settings could not be loaded.", exc_info=e)
+
         self.logger.info(f"I'm ready! Logged in as: {self.user} ({self.user.id})")
 
     async def change_status(self):
@@ -0,0 +1,31 @@
+CREATE TABLE IF NOT EXISTS user_blacklist(
+    id BIGINT UNIQUE,
+    reason TEXT
+);
+
+CREATE TABLE IF NOT EXISTS guild_blacklist(
+    id BIGINT UNIQUE,
+    reason TEXT
+);
+
+CREATE TABLE IF NOT EXISTS prefix(
+    guild BIGINT UNIQUE NOT NULL,
+    value TEXT NOT NULL,
+    mention BOOL DEFAULT FALSE
+);
+
+CREATE TABLE IF NOT EXISTS persistence(
+    guild BIGINT UNIQUE NOT NULL,
+    lvl_msg BOOL DEFAULT TRUE,
+    lvls BOOL DEFAULT TRUE
+);
+
+CREATE TABLE IF NOT EXISTS levels(
+    user_id BIGINT,
+    guild_id BIGINT,
+    xp BIGINT,
+    lvl INT,
+    cd REAL,
+    color INT,
+    bg TEXT
+);
@@ -0,0 +1,53 @@
+-- Collapse duplicate level rows into the one with the most XP before adding the primary key.
+DELETE FROM levels WHERE user_id IS NULL OR guild_id IS NULL;
+
+-- NULL xp has to be normalised first, or duplicates involving it compare as NULL and survive.
+UPDATE levels SET xp = 0 WHERE xp IS NULL;
+
+DELETE FROM levels a
+    USING levels b
+    WHERE a.user_id = b.user_id
+      AND a.guild_id = b.guild_id
+      AND (a.xp < b.xp OR (a.xp = b.xp AND a.ctid < b.ctid));
+
+UPDATE levels SET lvl = 1 WHERE lvl IS NULL;
+UPDATE levels SET cd = 0 WHERE cd IS NULL;
+UPDATE levels SET color = 16777215 WHERE color IS NULL;
+UPDATE levels SET bg = 'default' WHERE bg IS NULL;
+
+ALTER TABLE levels
+    ALTER COLUMN xp SET DEFAULT 0,
+    ALTER COLUMN xp SET NOT NULL,
+    ALTER COLUMN lvl SET DEFAULT 1,
+    ALTER COLUMN lvl SET NOT NULL,
+    ALTER COLUMN cd SET DEFAULT 0,
+    ALTER COLUMN cd SET NOT NULL,
+    ALTER COLUMN color SET DEFAULT 16777215,
+    ALTER COLUMN color SET NOT NULL,
+    ALTER COLUMN bg SET DEFAULT 'default',
+    ALTER COLUMN bg SET NOT NULL,
+    ADD PRIMARY KEY (user_id, guild_id);
+
+CREATE INDEX IF NOT EXISTS levels_guild_xp_idx ON levels (guild_id, xp DESC);
+
+ALTER TABLE prefix
+    DROP CONSTRAINT IF EXISTS prefix_guild_key,
+    ADD PRIMARY KEY (guild);
+
+UPDATE persistence SET lvl_msg = TRUE WHERE lvl_msg IS NULL;
+UPDATE persistence SET lvls = TRUE WHERE lvls IS NULL;
+ALTER TABLE persistence
+    DROP CONSTRAINT IF EXISTS persistence_guild_key,
+    ALTER COLUMN lvl_msg SET NOT NULL,
+    ALTER COLUMN lvls SET NOT NULL,
+    ADD PRIMARY KEY (guild);
+
+DELETE FROM user_blacklist WHERE id IS NULL;
+ALTER TABLE user_blacklist
+    DROP CONSTRAINT IF EXISTS user_blacklist_id_key,
+    ADD PRIMARY KEY (id);
+
+DELETE FROM guild_blacklist WHERE id IS NULL;
+ALTER TABLE guild_blacklist
+    DROP CONSTRAINT IF EXISTS guild_blacklist_id_key,
+    ADD PRIMARY KEY (id);
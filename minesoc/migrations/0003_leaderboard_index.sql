@@ -0,0 +1,3 @@
+-- Leaderboards order by (xp, user_id) descending so pages can be fetched with a row-value keyset.
+DROP INDEX IF EXISTS levels_guild_xp_idx;
+CREATE INDEX IF NOT EXISTS levels_guild_xp_user_idx ON levels (guild_id, xp DESC, user_id DESC);
@@ -0,0 +1,7 @@
+CREATE TABLE IF NOT EXISTS search_cache(
+    query TEXT PRIMARY KEY,
+    result JSONB NOT NULL,
+    cached_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS search_cache_cached_at_idx ON search_cache (cached_at DESC);
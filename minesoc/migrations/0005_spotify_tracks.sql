@@ -0,0 +1,6 @@
+CREATE TABLE IF NOT EXISTS spotify_tracks(
+    spotify_id TEXT PRIMARY KEY,
+    track TEXT NOT NULL,
+    info JSONB NOT NULL,
+    resolved_at TIMESTAMP NOT NULL DEFAULT now()
+);
@@ -0,0 +1,16 @@
+CREATE TABLE IF NOT EXISTS playlists(
+    id SERIAL PRIMARY KEY,
+    guild_id BIGINT NOT NULL,
+    user_id BIGINT NOT NULL,
+    name TEXT NOT NULL,
+    saved_at TIMESTAMP NOT NULL DEFAULT now(),
+    UNIQUE (guild_id, user_id, name)
+);
+
+CREATE TABLE IF NOT EXISTS playlist_tracks(
+    playlist_id INT NOT NULL REFERENCES playlists (id) ON DELETE CASCADE,
+    position INT NOT NULL,
+    track TEXT NOT NULL,
+    info JSONB NOT NULL,
+    PRIMARY KEY (playlist_id, position)
+);
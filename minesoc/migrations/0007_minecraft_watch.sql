@@ -0,0 +1,7 @@
+CREATE TABLE IF NOT EXISTS minecraft_watch(
+    guild_id BIGINT NOT NULL,
+    address TEXT NOT NULL,
+    added_by BIGINT NOT NULL,
+    added_at TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (guild_id, address)
+);
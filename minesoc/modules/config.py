@@ -2,91 +2,81 @@
 # This extension handles certain bot configurations.
 import asyncio
 import asyncpg
+from collections import namedtuple
 
 import discord
 from discord.ext import commands
 
-from minesoc.utils import checks
+from minesoc.utils import checks, cache
 
 
 class PrefixTooLong(commands.CommandError):
     pass
 
 
+# `resolved` is what determine_prefix hands to discord.py, built once when the entry is cached.
+Prefix = namedtuple("Prefix", "value mention resolved")
+
+
 class Config(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.bot.command_prefix = self.determine_prefix
         self.prefix_limit = 15
-
-        self.bot.loop.create_task(self.create_prefix_table())
-        self.bot.loop.create_task(self.create_persistence_table())
+        self.prefixes = cache.LRUCache(maxsize=self.bot.config.get("prefix_cache_size", 10000))
+        self.bot.pipeline.add("mention", self.mention_reply, priority=20)
 
     async def determine_prefix(self, bot, message):
         if not message.guild:
             return self.bot.config.default_prefix
 
-        async with self.bot.db.acquire() as conn:
-            prefix = await self._fetch_prefix(message.guild.id)
-            if prefix:
-                if prefix["mention"]:
-                    return commands.when_mentioned_or(prefix["value"])(bot, message)
-                else:
-                    return prefix["value"]
-            else:
-                return self.bot.config.default_prefix
-
-    async def create_prefix_table(self):
-        await self.bot.wait_until_ready()
-
-        query = "CREATE TABLE IF NOT EXISTS prefix(guild bigint UNIQUE NOT NULL, value text NOT NULL, mention bool " \
-                "DEFAULT FALSE) "
+        return (await self._fetch_prefix(message.guild.id)).resolved
 
-        await self.bot.db.execute(query)
-
-    async def create_persistence_table(self):
-        await self.bot.wait_until_ready()
-
-        query = "CREATE TABLE IF NOT EXISTS persistence(guild bigint UNIQUE NOT NULL, lvl_msg bool DEFAULT TRUE, " \
-                "lvls bool DEFAULT TRUE) "
-
-        await self.bot.db.execute(query)
+    def _cache_prefix(self, guild: int, value: str, mention: bool):
+        resolved = commands.when_mentioned_or(value)(self.bot, None) if mention else value
+        prefix = Prefix(value, mention, resolved)
+        self.prefixes.set(guild, prefix)
+        return prefix
 
     async def _fetch_prefix(self, guild: int):
-        async with self.bot.db.acquire() as conn:
-            return await conn.fetchrow("SELECT value, mention FROM prefix WHERE guild=$1", guild)
+        prefix = self.prefixes.get(guild)
+        if prefix is None:
+            row = await self.bot.db.fetchrow("SELECT value, mention FROM prefix WHERE guild=$1", guild)
+            # Guilds without a row are cached with the default so they don't query again.
+            if row:
+                prefix = self._cache_prefix(guild, row["value"], row["mention"])
+            else:
+                prefix = self._cache_prefix(guild, self.bot.config.default_prefix, False)
+
+        return prefix
 
     async def _set_prefix(self, guild: int, prefix: str):
         if len(prefix) > self.prefix_limit:
             raise PrefixTooLong
 
-        async with self.bot.db.acquire() as conn:
-            await conn.execute(
-                "INSERT INTO prefix (guild, value) VALUES ($1, $2) ON CONFLICT (guild) DO UPDATE SET "
-                "value=EXCLUDED.value WHERE EXCLUDED.guild=$1", guild, prefix)
+        row = await self.bot.db.fetchrow(
+            "INSERT INTO prefix (guild, value) VALUES ($1, $2) ON CONFLICT (guild) DO UPDATE SET "
+            "value=EXCLUDED.value RETURNING value, mention", guild, prefix)
+        self._cache_prefix(guild, row["value"], row["mention"])
 
     async def _set_prefix_mentionable(self, guild: int, boolean: bool):
-        async with self.bot.db.acquire() as conn:
-            await conn.execute(
-                "INSERT INTO prefix (guild, value) VALUES ($1, $2) ON CONFLICT (guild) DO UPDATE SET mention=$3 WHERE "
-                "EXCLUDED.guild=$1", guild, self.bot.config.default_prefix, boolean)
-
-    @commands.Cog.listener()
-    async def on_message(self, message: discord.Message):
-        if message.content in [f"<@!{self.bot.user.id}>", f"<@{self.bot.user.id}>"]:
-            prefix = await self._fetch_prefix(message.guild.id)
+        row = await self.bot.db.fetchrow(
+            "INSERT INTO prefix (guild, value, mention) VALUES ($1, $2, $3) ON CONFLICT (guild) DO UPDATE SET "
+            "mention=EXCLUDED.mention RETURNING value, mention", guild, self.bot.config.default_prefix, boolean)
+        self._cache_prefix(guild, row["value"], row["mention"])
+
+    async def mention_reply(self, ctx):
+        message = ctx.message
+        if ctx.guild and message.content in (f"<@!{self.bot.user.id}>", f"<@{self.bot.user.id}>"):
+            prefix = await self._fetch_prefix(ctx.guild.id)
             await message.channel.send(f"Hello {message.author.mention}!\nMy prefix is `{prefix.value}`")
 
     @commands.group(invoke_without_command=True)
     async def prefix(self, ctx: commands.Context):
         """Configure the guild's prefix"""
         prefix = await self._fetch_prefix(ctx.guild.id)
-        p = self.bot.config.default_prefix
-        m = False
-        if prefix:
-            p = prefix["value"]
-            if prefix["mention"]:
-                m = True
+        p = prefix.value
+        m = prefix.mention
 
         embed = discord.Embed(color=self.bot.colors.neutral)
         embed.set_author(name=str(ctx.guild.me), icon_url=self.bot.user.avatar_url_as(format="png"))
@@ -122,10 +112,7 @@ class Config(commands.Cog):
     async def prefix_mention(self, ctx: commands.Context):
         """Allow the bots mention to be used as prefix"""
         prefix = await self._fetch_prefix(ctx.guild.id)
-        mention = True
-        if prefix:
-            if prefix["mention"]:
-                mention = False
+        mention = not prefix.mention
 
         await self._set_prefix_mentionable(ctx.guild.id, mention)
         await ctx.success(description=f"Mentionable prefix {'enabled' if mention else 'disabled'}.")
@@ -135,14 +122,10 @@ class Config(commands.Cog):
     async def persistence(self, ctx):
         """Modify level related-systems of your guild."""
         guild = ctx.guild.id
-        config = await self.bot.db.fetchrow("SELECT * FROM persistence WHERE guild=$1", guild)
-
-        if not config:
-            await self.bot.db.execute("INSERT INTO persistence(guild, lvl_msg, lvls) VALUES($1, TRUE, TRUE)", guild)
-            config = await self.bot.db.fetchrow("SELECT * FROM persistence WHERE guild=$1", guild)
+        config = self.bot.persistence.get(guild)
 
-        do_msg = config["lvl_msg"]
-        do_lvl = config["lvls"]
+        do_msg = config.lvl_msg
+        do_lvl = config.lvls
 
         check = {True: "Enabled", False: "Disabled"}
         title = f"{ctx.guild.name} Persistence Settings"
@@ -163,17 +146,17 @@ class Config(commands.Cog):
             if sub_menu:
                 if title == "Edit Persistence Settings":
                     if sub_menu == "1":
-                        await self.bot.db.execute("UPDATE persistence SET lvls=TRUE WHERE guild=$1", guild)
+                        await self.bot.persistence.set(guild, lvls=True)
                         await ctx.success(f"**{ctx.author.name}**, you enabled the level system.")
                     else:
-                        await self.bot.db.execute("UPDATE persistence SET lvls=FALSE WHERE guild=$1", guild)
+                        await self.bot.persistence.set(guild, lvls=False)
                         await ctx.success(f"**{ctx.author.name}**, you disabled the level system.")
                 else:
                     if sub_menu == "1":
-                        await self.bot.db.execute("UPDATE persistence SET lvl_msg=TRUE WHERE guild=$1", guild)
+                        await self.bot.persistence.set(guild, lvl_msg=True)
                         await ctx.success(f"**{ctx.author.name}**, you enabled level-up messages.")
                     else:
-                        await self.bot.db.execute("UPDATE persistence SET lvl_msg=FALSE WHERE guild=$1", guild)
+                        await self.bot.persistence.set(guild, lvl_msg=False)
                         await ctx.success(f"**{ctx.author.name}**, you disabled level-up messages.")
 
     async def cog_command_error(self, ctx: commands.Context, error: commands.CommandError):
@@ -183,6 +166,7 @@ class Config(commands.Cog):
 
     def cog_unload(self):
         self.bot.command_prefix = self.bot.config.default_prefix
+        self.bot.pipeline.remove("mention")
 
 
 def setup(bot):
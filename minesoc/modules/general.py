@@ -4,12 +4,12 @@ import re
 import time
 import discord
 import psutil
-import spotipy
 
-from minesoc.utils import images
 from discord.ext import commands
 from io import BytesIO
 
+from minesoc.utils.spotify import SpotifyError
+
 
 class General(commands.Cog):
     def __init__(self, bot):
@@ -117,16 +117,14 @@ class General(commands.Cog):
                         value=" | ".join([r.mention for r in member.roles if r != ctx.guild.default_role]),
                         inline=False)
         if isinstance(member.activity, discord.Spotify):
-            card = images.SpotifyImage()
-
-            album_bytes = await card.fetch_cover(member.activity.album_cover_url)
+            cover = await self.bot.api.covers.fetch(member.activity.album_cover_url)
             color = member.activity.color.to_rgb()
 
             end = member.activity.end
             duration = member.activity.duration
-            buffer = card.draw(member.activity.title, member.activity.artists, color, BytesIO(album_bytes), duration,
-                               end)
-            file = discord.File(fp=buffer, filename="spotify.png")
+            buffer = await self.bot.render.spotify(member.activity.title, member.activity.artists, color, cover,
+                                                   duration, end)
+            file = discord.File(fp=BytesIO(buffer), filename="spotify.png")
             embed.set_image(url="attachment://spotify.png")
         elif member.activity:
             embed.add_field(name=f"Activity",
@@ -163,21 +161,20 @@ class General(commands.Cog):
             if user.activities:
                 for activity in user.activities:
                     if isinstance(activity, discord.Spotify):
-                        card = images.SpotifyImage()
-
-                        album_bytes = await card.fetch_cover(activity.album_cover_url)
+                        cover = await self.bot.api.covers.fetch(activity.album_cover_url)
                         color = activity.color.to_rgb()
 
                         end = activity.end
                         duration = activity.duration
-                        buffer = card.draw(activity.title, activity.artists, color, BytesIO(album_bytes), duration, end)
+                        buffer = await self.bot.render.spotify(activity.title, activity.artists, color, cover,
+                                                               duration, end)
                         url = f"<https://open.spotify.com/track/{activity.track_id}>"
                         await ctx.message.delete()
                         embed = discord.Embed(
                             description=f"{self.bot.custom_emojis.spotify} {user.mention} is listening to:\n**{url}**",
                             color=activity.color)
                         embed.set_footer(text=f"Requested by {ctx.author.name}", icon_url=ctx.author.avatar_url)
-                        file = discord.File(fp=buffer, filename="spotify.png")
+                        file = discord.File(fp=BytesIO(buffer), filename="spotify.png")
                         embed.set_image(url="attachment://spotify.png")
                         return await ctx.send(embed=embed, file=file)
 
@@ -191,33 +188,28 @@ class General(commands.Cog):
     async def spotify_get(self, ctx, spotify_link):
         """Get a Spotify track as an image."""
         async with ctx.typing():
-            credentials = spotipy.SpotifyClientCredentials(client_id=str(self.bot.config.spotify_id),
-                                                           client_secret=str(self.bot.config.spotify_secret))
-            token = credentials.get_access_token()
-            spotify = spotipy.Spotify(auth=token)
-
             uri = "spotify:"
             res = re.search("com/(.*)\\?si=", spotify_link).group(1)
             res = res.replace("/", ":")
             uri += res
             track = uri.split(":")[2]
 
-            card = images.SpotifyImage()
-            result = spotify.track(track)
+            result = await self.bot.api.spotify.track(track)
             url = f"<{result['external_urls']['spotify']}>"
-            album_bytes = await card.fetch_cover(f"{result['album']['images'][0]['url']}")
+            cover = await self.bot.api.covers.fetch(f"{result['album']['images'][0]['url']}")
             track_name = result["name"]
             track_artists = (i["name"] for i in result["artists"])
             duration = result["duration_ms"] / 1000
-            buffer = card.draw(track_name, track_artists, self.bot.colors.spotify.to_rgb(),
-                               BytesIO(album_bytes), duration)
+            buffer = await self.bot.render.spotify(track_name, track_artists,
+                                                   discord.Color(self.bot.colors.spotify).to_rgb(), cover, duration)
             await ctx.message.delete()
             await ctx.send(f"{self.bot.custom_emojis.spotify} **{url}** {ctx.author.mention}",
-                           file=discord.File(fp=buffer, filename="spotify.png"))
+                           file=discord.File(fp=BytesIO(buffer), filename="spotify.png"))
 
     @spotify.error
+    @spotify_get.error
     async def spotify_error(self, ctx, error):
-        if isinstance(error, spotipy.SpotifyException):
+        if isinstance(getattr(error, "original", error), SpotifyError):
             await ctx.error(description=f"Could not provide given track or the Spotify authentication is invalid.\n"
                                         f"{error}")
 
@@ -1,11 +1,12 @@
 # levels.py
 # This extension handles level ups
-import aiohttp.client
+import asyncio
 import discord
 
 from io import BytesIO
 from discord.ext import commands
-from minesoc.utils import images
+
+from minesoc.utils import render, images
 
 
 class Levels(commands.Cog):
@@ -15,21 +16,13 @@ class Levels(commands.Cog):
         self.bot = bot
         self.leaderboard_emojis = {1: "🥇", 2: "🥈", 3: "🥉"}
 
-        self.bot.loop.create_task(self.create_table())
-
-    async def create_table(self):
-        await self.bot.wait_until_ready()
-
-        query = "CREATE TABLE IF NOT EXISTS levels(user_id BIGINT, guild_id BIGINT, xp BIGINT, lvl INT, cd REAL, " \
-                "color INT, bg TEXT)"
-
-        await self.bot.db.execute(query)
-
     async def cog_before_invoke(self, ctx):
-        persistence = await self.bot.db.fetchrow("SELECT lvls FROM persistence WHERE guild=$1", ctx.guild.id)
-        if not persistence["lvls"]:
+        if not self.bot.persistence.get(ctx.guild.id).lvls:
             raise commands.DisabledCommand
 
+        # Level commands read and write the levels table directly, so this guild's pending XP has to land first.
+        await self.bot.xp.flush(ctx.guild.id)
+
     async def cog_command_error(self, ctx, error):
         if isinstance(error, commands.DisabledCommand):
             await ctx.error(description="The level system has been disabled for this guild.")
@@ -44,21 +37,28 @@ class Levels(commands.Cog):
             if member.bot:
                 return
 
-            profile = images.Profile()
-
             member_id = member.id
             guild = ctx.guild.id
 
             user = await self.bot.db.fetchrow("SELECT * FROM levels WHERE user_id=$1 AND guild_id=$2", member_id, guild)
             if user:
-                async with ctx.typing(), aiohttp.ClientSession() as session:
-                    async with session.get(f"{member.avatar_url}") as r:
-                        profile_bytes = await r.read()
-
                 color = discord.Color(user["color"]).to_rgb()
-                buffer = profile.draw(member.name, user["lvl"], user["xp"], BytesIO(profile_bytes), color, user["bg"])
-
-                await ctx.send(file=discord.File(fp=buffer, filename="card.png"))
+                # The URL carries the avatar hash, so it doubles as the avatar's cache key.
+                avatar_url = str(member.avatar_url_as(static_format="png", size=256))
+                key = render.card_key(member.name, user["lvl"], user["xp"], color, user["bg"], avatar_url)
+
+                buffer = self.bot.render.cards.get(key)
+                if buffer is None:
+                    async with ctx.typing():
+                        avatar = await self.bot.api.avatars.fetch(avatar_url)
+                        if avatar is None:
+                            return await ctx.error(description="I couldn't download that avatar. Try again later.")
+
+                        buffer = await self.bot.render.profile(member.name, user["lvl"], user["xp"], avatar, color,
+                                                               user["bg"])
+                    self.bot.render.cards.set(key, buffer)
+
+                await ctx.send(file=discord.File(fp=BytesIO(buffer), filename="card.png"))
             else:
                 await ctx.send(f"**{ctx.author.name}**, "
                                f"{'this member has not' if member != ctx.author else 'you have not'} received XP yet.")
@@ -78,35 +78,52 @@ class Levels(commands.Cog):
     async def profile_background(self, ctx, bg: str = None):
         """Changes the background image of your rank card. Change image to "default" to reset your background image."""
         bg = bg.lower() if bg is not None else bg
-        available_bgs = [file.name[:-4] for file in (self.bot.path / "backgrounds").iterdir() if file.name[:-4]]
-
         member = ctx.author.id
         guild = ctx.guild.id
 
-        if bg in available_bgs:
+        if bg == "default" or bg in images.backgrounds:
             await self.bot.db.execute("UPDATE levels SET bg = $1 WHERE user_id = $2 AND guild_id = $3",
                                       bg, member, guild)
             embed = discord.Embed()
             embed.title = f"Changed your image to `{bg}`" if bg != "default" else "Reset your profile background."
             await ctx.send(embed=embed)
         else:
-            await ctx.send(f"```{', '.join(available_bgs)}```")
+            await ctx.send(f"```{', '.join(images.backgrounds.names)}```")
 
-    @commands.command(pass_context=True, aliases=["lb", "ranks", "levels"])
-    async def leaderboard(self, ctx):
-        """Shows the top 10 users of your guild."""
-        guild = ctx.guild.id
-        users = await self.bot.db.fetch("SELECT * FROM levels WHERE guild_id=$1 ORDER BY xp DESC", guild)
+    async def fetch_page(self, guild: int, after=None, limit=10):
+        """One page of the leaderboard. `after` is the (xp, user_id) of the last row on the previous page."""
+        if self.bot.leaderboards.enabled:
+            return (await self.bot.leaderboards.get(guild)).page(after, limit)
 
-        ranks = {(y := x + 1): f"#{y}" if y > 3 else f"{self.leaderboard_emojis[y]}" for x in range(10)}
+        if after is None:
+            return await self.bot.db.fetch("SELECT user_id, xp, lvl FROM levels WHERE guild_id=$1 "
+                                           "ORDER BY xp DESC, user_id DESC LIMIT $2", guild, limit)
+
+        return await self.bot.db.fetch("SELECT user_id, xp, lvl FROM levels WHERE guild_id=$1 "
+                                       "AND (xp, user_id) < ($2, $3) ORDER BY xp DESC, user_id DESC LIMIT $4",
+                                       guild, *after, limit)
+
+    async def fetch_rank(self, guild: int, member: int):
+        if self.bot.leaderboards.enabled:
+            return (await self.bot.leaderboards.get(guild)).rank(member)
+
+        return await self.bot.db.fetchrow("SELECT l.xp, l.lvl, (SELECT COUNT(*) FROM levels r WHERE r.guild_id=$1 "
+                                          "AND (r.xp, r.user_id) > (l.xp, l.user_id)) + 1 AS rank "
+                                          "FROM levels l WHERE l.guild_id=$1 AND l.user_id=$2", guild, member)
+
+    def format_rank(self, rank):
+        return self.leaderboard_emojis.get(rank, f"#{rank}")
+
+    def leaderboard_embed(self, ctx, rows, start, author):
         fields = {"member": [], "level": [], "rank": []}
+        top_user = None
 
-        for index, value in zip(range(10), users):
+        for rank, value in enumerate(rows, start=start):
             user = self.bot.get_user(value["user_id"])
             if user:
-                if (rank := index + 1) == 1:
+                if rank == 1:
                     top_user = f"Top Member: 🏆 **{str(user)}**"
-                fields["rank"].append(ranks[rank])
+                fields["rank"].append(self.format_rank(rank))
                 fields["member"].append(f"**{user.name}**")
                 xp = round((4 * (value['lvl'] ** 3) / 5))
                 fields["level"].append(f"Level {value['lvl']} ({value['xp']}/{xp})")
@@ -114,15 +131,13 @@ class Levels(commands.Cog):
             for value in fields.values():
                 value.append("...")
 
-        leaderboard = discord.Embed(color=ctx.me.colour, title=f"Top 10 in {ctx.guild.name}", description=top_user,
+        title = f"Top 10 in {ctx.guild.name}" if start == 1 else f"Ranks {start}-{start + 9} in {ctx.guild.name}"
+        leaderboard = discord.Embed(color=ctx.me.colour, title=title, description=top_user,
                                     timestamp=ctx.message.created_at)
         leaderboard.set_author(name=ctx.author.name, icon_url=ctx.author.avatar_url)
 
-        author = await self.bot.db.fetchrow("SELECT * FROM levels WHERE user_id=$1 AND guild_id=$2",
-                                            ctx.author.id, guild)
-
         if author:
-            fields["rank"].append(ranks[users.index(author) + 1])
+            fields["rank"].append(self.format_rank(author["rank"]))
             fields["member"].append(f"**{ctx.author.name}**")
             xp = round((4 * (author['lvl'] ** 3) / 5))
             fields["level"].append(f"Level {author['lvl']} ({author['xp']}/{xp})")
@@ -131,7 +146,61 @@ class Levels(commands.Cog):
         leaderboard.add_field(name="Member", value="\n".join(fields["member"]), inline=True)
         leaderboard.add_field(name="Level", value="\n".join(fields["level"]), inline=True)
 
-        await ctx.send(embed=leaderboard)
+        return leaderboard
+
+    @commands.command(pass_context=True, aliases=["lb", "ranks", "levels"])
+    async def leaderboard(self, ctx):
+        """Shows the top 10 users of your guild. React with the arrows to page through the ranks."""
+        guild = ctx.guild.id
+        page_size = 10
+
+        rows = await self.fetch_page(guild, limit=page_size)
+        author = await self.fetch_rank(guild, ctx.author.id)
+        # Keyset cursor of every page shown so far; the last one is the current page.
+        cursors = [None]
+
+        message = await ctx.send(embed=self.leaderboard_embed(ctx, rows, 1, author))
+        if len(rows) < page_size:
+            return
+
+        buttons = ["◀️", "▶️"]
+        for button in buttons:
+            await message.add_reaction(button)
+
+        def _check(reaction, user):
+            return user.id == ctx.author.id and reaction.message.id == message.id and str(reaction) in buttons
+
+        while True:
+            try:
+                reaction, user = await self.bot.wait_for("reaction_add", timeout=60, check=_check)
+            except asyncio.TimeoutError:
+                break
+
+            try:
+                await message.remove_reaction(reaction, user)
+            except discord.HTTPException:
+                pass
+
+            if str(reaction) == buttons[1] and len(rows) == page_size:
+                cursor = (rows[-1]["xp"], rows[-1]["user_id"])
+                next_rows = await self.fetch_page(guild, after=cursor, limit=page_size)
+                if not next_rows:
+                    continue
+                cursors.append(cursor)
+                rows = next_rows
+            elif str(reaction) == buttons[0] and len(cursors) > 1:
+                cursors.pop()
+                rows = await self.fetch_page(guild, after=cursors[-1], limit=page_size)
+            else:
+                continue
+
+            start = (len(cursors) - 1) * page_size + 1
+            await message.edit(embed=self.leaderboard_embed(ctx, rows, start, author))
+
+        try:
+            await message.clear_reactions()
+        except discord.HTTPException:
+            pass
 
     @profile_color.error
     async def color_error(self, ctx, error):
@@ -1,16 +1,19 @@
 import asyncio
-import time
 import discord
 import asyncpg
 
 from discord.ext import commands
 
-CD = 120
+from minesoc.utils import errors
 
 
 class Listeners(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.bot.pipeline.add("xp", self.award_xp, priority=10)
+
+    def cog_unload(self):
+        self.bot.pipeline.remove("xp")
 
     async def bot_check(self, ctx):
         if not ctx.guild:
@@ -22,38 +25,21 @@ class Listeners(commands.Cog):
 
         return True
 
-    @commands.Cog.listener()
-    async def on_message(self, message):
-        ctx = await self.bot.get_context(message)
+    async def award_xp(self, ctx):
+        message = ctx.message
 
-        guild = message.guild.id
-        author = message.author.id
+        if not ctx.guild or message.author.bot or ctx.valid:
+            return
 
-        await self.bot.db.execute("INSERT INTO persistence (guild, lvl_msg, lvls) "
-                                  "VALUES ($1, TRUE, TRUE) "
-                                  "ON CONFLICT (guild) DO NOTHING", guild)
+        guild = ctx.guild.id
+        author = message.author.id
 
-        if message.author.bot or ctx.valid:
-            return
+        config = self.bot.persistence.get(guild)
+        if config.lvls:
+            lvl = await self.bot.xp.award(guild, author)
 
-        config = await self.bot.db.fetchrow("SELECT * FROM persistence WHERE guild=$1", guild)
-        if config["lvls"]:
-            xp = self.bot.xp_gain()
-            await self.bot.db.execute("INSERT INTO levels (user_id, guild_id, xp, lvl, cd, color, bg) "
-                                      "SELECT $1, $2, $3, 1, $4, $5, 'default' "
-                                      "WHERE NOT EXISTS (SELECT 1 FROM levels WHERE user_id=$1 AND guild_id=$2)",
-                                      author, guild, xp, time.time(), 0xFFFFFF)
-            user = await self.bot.db.fetchrow("SELECT * FROM levels WHERE user_id=$1 AND guild_id=$2", author, guild)
-
-            if time.time() - user["cd"] > CD:
-                await self.bot.db.execute("UPDATE levels SET xp = $1, cd= $2 WHERE user_id = $3 AND guild_id = $4",
-                                          user["xp"] + xp, time.time(), author, guild)
-
-                if user["xp"] + xp >= round((4 * (user["lvl"] ** 3) / 5)):
-                    await self.bot.db.execute("UPDATE levels SET lvl = $1 WHERE user_id = $2 AND guild_id = $3",
-                                              user["lvl"] + 1, author, guild)
-                    if config["lvl_msg"]:
-                        await ctx.send(f"🆙 | **{message.author.name}** is now **Level {user['lvl'] + 1}**")
+            if lvl and config.lvl_msg:
+                await ctx.send(f"🆙 | **{message.author.name}** is now **Level {lvl}**")
 
     @commands.Cog.listener()
     async def on_command_error(self, ctx: commands.Context, error: commands.CommandError):
@@ -94,6 +80,9 @@ class Listeners(commands.Cog):
         elif isinstance(error, commands.CommandOnCooldown):
             await ctx.error(description=f"You're on cooldown! Retry in `{error.retry_after:,.2f}` seconds.")
 
+        elif isinstance(error, errors.RenderBusy):
+            await ctx.error(description="I'm busy drawing other images right now. Try again in a moment.")
+
         elif isinstance(error, commands.CommandNotFound):
             await ctx.message.add_reaction("❓")
             await asyncio.sleep(15)
@@ -101,9 +90,7 @@ class Listeners(commands.Cog):
 
     @commands.Cog.listener()
     async def on_guild_join(self, guild):
-        check = await self.bot.db.fetchrow("SELECT EXISTS(SELECT 1 FROM guild_blacklist WHERE id=$1)", guild.id)
-
-        if check["exists"]:
+        if guild.id in self.bot.blacklist.guilds:
             try:
                 embed = discord.Embed(color=self.bot.colors.red,
                                       description=f"Your guild / server tried to add me, but the ID is blacklisted. "
@@ -113,6 +100,8 @@ class Listeners(commands.Cog):
                 await guild.leave()
             except Exception:
                 pass
+        else:
+            await self.bot.persistence.provision([guild.id])
 
 
 def setup(bot):
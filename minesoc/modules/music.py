@@ -1,14 +1,18 @@
 # music.py
 # Uses an alternative library for playing music
 
+import asyncio
+import json
 import math
 import re
+import time
 
 import discord
 import lavalink
-import spotipy
 from discord.ext import commands
 
+from minesoc.utils import audio, nodes
+
 url_rx = re.compile("https?://(?:www\\.)?.+")  # noqa: W605
 spotify_url_rx = re.compile("https?://(?:open\\.)?.+")
 
@@ -17,39 +21,154 @@ class Music(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.spotify_types = ["album", "playlist", "track"]
+        self.jobs = {}
+        self.lazy = {}
+        self.idle = {}
+        self.reaped = 0
 
         if not hasattr(bot, "lavalink"):  # This ensures the client isn"t overwritten during cog reloads.
             bot.lavalink = lavalink.Client(bot.user.id, loop=self.bot.loop)
-            bot.lavalink.add_node(**self.bot.config.lavalink)
+            config = self.bot.config.lavalink
+            for node in (config if isinstance(config, list) else [config]):
+                bot.lavalink.add_node(**node)
             bot.add_listener(bot.lavalink.voice_update_handler, "on_socket_response")
 
+            bot.nodes = nodes.NodePool(bot, bot.lavalink, interval=self.bot.config.get("node_check_interval", 30),
+                                       cpu_limit=self.bot.config.get("node_cpu_limit", 0.9),
+                                       deficit_limit=self.bot.config.get("node_deficit_limit", 0.1))
+            self.bot.loop.create_task(bot.nodes.run())
+
         bot.lavalink.add_event_hook(self.track_hook)
+        self.reaper = self.bot.loop.create_task(self.reap_idle(self.bot.config.get("player_idle_timeout", 300)))
+
+    def queue_spotify(self, guild_id: int, tracks, player: lavalink.DefaultPlayer, requester):
+        previous = self.jobs.get(guild_id)
+        if previous is not None and previous.done:
+            previous = None
+
+        job = audio.ResolveJob(player, tracks, requester, self.bot.searches, self.bot.spotify_tracks,
+                               concurrency=self.bot.config.get("resolve_concurrency", 5), previous=previous)
+        self.jobs[guild_id] = job
+        job.start()
+        return job
+
+    def queue_lazily(self, guild_id: int, player: lavalink.DefaultPlayer) -> audio.LazyQueue:
+        lazy = self.lazy.get(guild_id)
+        if lazy is None or lazy.player is not player:
+            lazy = self.lazy[guild_id] = audio.LazyQueue(player, self.bot.searches, self.bot.spotify_tracks,
+                                                         ahead=self.bot.config.get("lazy_queue_ahead", 3),
+                                                         shuffled=player.shuffle)
+        return lazy
+
+    def pending(self, guild_id: int):
+        lazy = self.lazy.get(guild_id)
+        return lazy if lazy else None
+
+    def enqueue(self, guild_id: int, player: lavalink.DefaultPlayer, track, requester):
+        """Adds a resolved track, behind any tracks that are still waiting to be resolved."""
+        lazy = self.pending(guild_id)
+        if lazy is not None:
+            lazy.add(track, requester)
+        else:
+            player.add(requester=requester, track=track)
 
-    async def queue_spotify(self, tracks, player: lavalink.DefaultPlayer, requester):
-        for i in range(len(tracks)):
-            track = tracks[i]["track"]
+    async def fill_ahead(self, guild_id: int):
+        lazy = self.pending(guild_id)
+        if lazy is None or self.queueing(guild_id):
+            return 0
 
-            song = track["name"]
-            artist = track["artists"][0]["name"]
+        try:
+            return await lazy.fill()
+        except Exception as e:
+            self.bot.logger.error("Failed to resolve queued tracks.", exc_info=e)
+            return 0
+
+    def cancel_queueing(self, guild_id: int):
+        job = self.jobs.pop(guild_id, None)
+        if job is not None:
+            job.cancel()
+
+        lazy = self.lazy.pop(guild_id, None)
+        if lazy is not None:
+            lazy.clear()
+
+    def queueing(self, guild_id: int):
+        job = self.jobs.get(guild_id)
+        return job if job is not None and not job.done else None
+
+    async def report_progress(self, message: discord.Message, job: audio.ResolveJob, interval=5):
+        embed = message.embeds[0]
+        while not job.done:
+            await asyncio.wait([job.task], timeout=interval)
+
+            if job.task.done() and job.task.cancelled():
+                status = "Cancelled"
+            else:
+                status = "Done" if job.done else "Resolving"
+            embed.description = f"{status} - {job.queued}/{job.total} tracks queued" + \
+                                (f", {job.failed} not found" if job.failed else "")
+            try:
+                await message.edit(embed=embed)
+            except discord.HTTPException:
+                return
+
+    def resident(self):
+        """Returns how many players and queued tracks (resolved or not) are held in memory."""
+        players = list(self.bot.lavalink.players.players.values())
+        tracks = sum(len(player.queue) for player in players) + sum(len(lazy) for lazy in self.lazy.values())
+        return len(players), tracks
+
+    def is_idle(self, player: lavalink.DefaultPlayer):
+        if not player.is_connected or player.paused:
+            return True
+        return not player.is_playing and not player.queue and not self.pending(int(player.guild_id)) \
+            and not self.queueing(int(player.guild_id))
+
+    async def reap_idle(self, timeout, interval=60):
+        """Destroys players that have been disconnected, paused or empty for longer than `timeout` seconds."""
+        while not self.bot.is_closed():
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            players = dict(self.bot.lavalink.players.players)
+            for guild_id in set(self.idle) - set(players):
+                del self.idle[guild_id]
+
+            for guild_id, player in players.items():
+                if not self.is_idle(player):
+                    self.idle.pop(guild_id, None)
+                    continue
+
+                if now - self.idle.setdefault(guild_id, now) < timeout:
+                    continue
+
+                try:
+                    await self.destroy_player(guild_id, player)
+                except Exception as e:
+                    self.bot.logger.warning(f"Could not destroy idle player {guild_id}.", exc_info=e)
+
+    async def destroy_player(self, guild_id: int, player: lavalink.DefaultPlayer):
+        self.idle.pop(guild_id, None)
+        self.cancel_queueing(guild_id)
+        player.queue.clear()
+        player.store("context", None)  # Drops the last command's message, channel and guild references.
 
-            if not track["is_local"]:
-                search = f"ytsearch:{song} {artist} lyrics"
-                result = await player.node.get_tracks(search)
-                if result["tracks"]:
-                    if not player.is_playing and i == 0:
-                        await player.play(lavalink.AudioTrack.build(track=result["tracks"][0], requester=requester))
-                    else:
-                        player.add(track=result["tracks"][0], requester=requester)
+        if player.is_connected:
+            await self.connect_to(guild_id, None)
+        await self.bot.lavalink.players.destroy(guild_id)
+        self.reaped += 1
 
     def cog_unload(self):
+        self.reaper.cancel()
         self.bot.lavalink._event_hooks.clear()
+        for guild_id in set(self.jobs) | set(self.lazy):
+            self.cancel_queueing(guild_id)
 
     async def cog_before_invoke(self, ctx):
         guild_check = ctx.guild is not None
         #  This is essentially the same as `@commands.guild_only()`
         #  except it saves us repeating ourselves (and also a few lines).
 
-        if guild_check:
+        if guild_check and ctx.command.qualified_name not in ("playlist", "playlist list", "playlist delete"):
             await self.ensure_voice(ctx)
             #  Ensure that the bot and command author share a mutual voicechannel.
 
@@ -58,9 +177,14 @@ class Music(commands.Cog):
     async def track_hook(self, event):
         if isinstance(event, lavalink.events.QueueEndEvent):
             guild_id = int(event.player.guild_id)
+            if self.queueing(guild_id):
+                return  # The rest of a playlist is still being resolved.
+            if await self.fill_ahead(guild_id) and not event.player.is_playing:
+                return await event.player.play()
             await self.connect_to(guild_id, None)
             # Disconnect from the channel -- there's nothing else to play.
         if isinstance(event, lavalink.events.TrackStartEvent):
+            asyncio.ensure_future(self.fill_ahead(int(event.player.guild_id)))
             if not event.player.loop:
                 context = event.player.fetch("context")
                 track = event.player.fetch("track")
@@ -92,11 +216,6 @@ class Music(commands.Cog):
                     if i in query:
                         spotify_type = i
 
-                credentials = spotipy.SpotifyClientCredentials(client_id=self.bot.config.spotify_id,
-                                                               client_secret=self.bot.config.spotify_secret)
-                token = credentials.get_access_token()
-                sp = spotipy.Spotify(auth=token)
-
                 if re.match(spotify_url_rx, query):
                     spotify_id = re.search(f"{spotify_type}/(.*)\\?si=", query).group(
                         1) if "?si=" in query else re.search(f"{spotify_type}/(.*)", query).group(1)
@@ -104,36 +223,54 @@ class Music(commands.Cog):
                     spotify_id = query.split(":")[-1]
 
                 if spotify_type == "track":
-                    results = sp.track(spotify_id)
-                    track = results
-                    search = f"ytsearch:{track['name']} {track['artists'][0]['name']}"
-                    res = await player.node.get_tracks(search)
+                    spotify_track = await self.bot.api.spotify.track(spotify_id)
+                    entry = audio.SpotifyTrack.from_api(spotify_track)
+                    track = (await self.bot.spotify_tracks.lookup(player.node, [entry])).get(entry.id)
+
+                    if track is None:
+                        # Same query as playlists and revalidation, so the stored mapping stays stable.
+                        res = await self.bot.searches.get_tracks(player.node, entry.query)
 
-                    if res["tracks"]:
-                        to_play = res["tracks"][0]
-                        player.add(requester=ctx.author.id, track=to_play)
+                        if not res or not res["tracks"]:
+                            return await ctx.send("Nothing found!")
+
+                        track = res["tracks"][0]
+                        if entry.id:
+                            await self.bot.spotify_tracks.store([(entry.id, track)])
+
+                    self.enqueue(ctx.guild.id, player, track, ctx.author.id)
 
                     embed.title = "Track Enqueued!"
-                    embed.description = f"[{to_play['info']['title']}]({to_play['info']['uri']})"
+                    embed.description = f"[{track['info']['title']}]({track['info']['uri']})"
 
                 else:
                     if spotify_type == "album":
-                        results = sp.album_tracks(spotify_id)
+                        tracks = await self.bot.api.spotify.album_tracks(spotify_id)
                     else:
-                        results = sp.playlist_tracks(spotify_id)
-
-                    tracks = results["items"]
-                    while results["next"]:
-                        results = sp.next(results)
-                        tracks.extend(results["items"])
-
-                    self.task = self.bot.loop.create_task(self.queue_spotify(tracks, player, ctx.author.id))
+                        tracks = await self.bot.api.spotify.playlist_tracks(spotify_id)
+
+                    embed.title = f"{spotify_type.title()} Enqueued!"
+                    if self.pending(ctx.guild.id) or len(tracks) > self.bot.config.get("lazy_queue_threshold", 100):
+                        # Only the next few tracks are resolved, just ahead of playback.
+                        self.queue_lazily(ctx.guild.id, player).extend(tracks, ctx.author.id)
+                        embed.description = f"{len(tracks)} tracks queued, resolved as they come up"
+                        await ctx.send(embed=embed)
+                        if not player.is_playing and await self.fill_ahead(ctx.guild.id):
+                            await player.play()
+                        return
+
+                    # The job starts playback itself once the first track is resolved.
+                    job = self.queue_spotify(ctx.guild.id, tracks, player, ctx.author.id)
+                    embed.description = f"Resolving - 0/{job.total} tracks queued"
+                    message = await ctx.send(embed=embed)
+                    self.bot.loop.create_task(self.report_progress(message, job))
+                    return
 
             else:
                 if not re.match(url_rx, query) and not query.startswith("ytsearch:"):
                     query = f"ytsearch:{query}"
 
-                results = await player.node.get_tracks(query)
+                results = await self.bot.searches.get_tracks(player.node, query)
 
                 if not results or not results["tracks"]:
                     return await ctx.send("Nothing found!")
@@ -142,7 +279,7 @@ class Music(commands.Cog):
                     tracks = results["tracks"]
 
                     for track in tracks:
-                        player.add(requester=ctx.author.id, track=track)
+                        self.enqueue(ctx.guild.id, player, track, ctx.author.id)
 
                     embed.title = "Playlist Enqueued!"
                     embed.description = f"{results['playlistInfo']['name']} - {len(tracks)} tracks"
@@ -150,7 +287,7 @@ class Music(commands.Cog):
                     track = results["tracks"][0]
                     embed.title = "Track Enqueued"
                     embed.description = f"[{track['info']['title']}]({track['info']['uri']})"
-                    player.add(requester=ctx.author.id, track=track)
+                    self.enqueue(ctx.guild.id, player, track, ctx.author.id)
 
             player.store("track", track["info"]["uri"])
 
@@ -185,15 +322,12 @@ class Music(commands.Cog):
         """ Stops the player and clears its queue. """
         player = self.bot.lavalink.players.get(ctx.guild.id)
 
-        if not player.is_playing:
+        if not player.is_playing and not self.queueing(ctx.guild.id):
             return await ctx.send("Not playing.")
 
         player.queue.clear()
+        self.cancel_queueing(ctx.guild.id)
         await player.stop()
-        try:
-            self.task.cancel()
-        except Exception:
-            pass
         await ctx.send("⏹ | Stopped.")
 
     @commands.command(aliases=["np", "n", "playing"])
@@ -219,12 +353,14 @@ class Music(commands.Cog):
     async def queue(self, ctx, page: int = 1):
         """ Shows the player"s queue. """
         player = self.bot.lavalink.players.get(ctx.guild.id)
+        lazy = self.pending(ctx.guild.id) or ()
+        total = len(player.queue) + len(lazy)
 
-        if not player.queue:
+        if not total:
             return await ctx.send("Nothing queued.")
 
         items_per_page = 10
-        pages = math.ceil(len(player.queue) / items_per_page)
+        pages = math.ceil(total / items_per_page)
 
         start = (page - 1) * items_per_page
         end = start + items_per_page
@@ -233,9 +369,25 @@ class Music(commands.Cog):
         for index, track in enumerate(player.queue[start:end], start=start):
             queue_list += f"`{index + 1}.` [**{track.title}**]({track.uri})\n"
 
+        offset = len(player.queue)
+        for index, entry in enumerate(lazy.entries[max(start - offset, 0):max(end - offset, 0)] if lazy else (),
+                                      start=max(start, offset)):
+            if isinstance(entry, audio.SpotifyTrack):
+                title = f"{entry.name} - {entry.artist}"
+                queue_list += f"`{index + 1}.` [**{title}**]({entry.url})\n" if entry.url else \
+                    f"`{index + 1}.` **{title}**\n"
+            else:
+                queue_list += f"`{index + 1}.` [**{entry.track['info']['title']}**]({entry.track['info']['uri']})\n"
+
         embed = discord.Embed(colour=discord.Color.blurple(),
-                              description=f"**{len(player.queue)} tracks**\n\n{queue_list}")
-        embed.set_footer(text=f"Viewing page {page}/{pages}")
+                              description=f"**{total} tracks**\n\n{queue_list}")
+        footer = f"Viewing page {page}/{pages}"
+        job = self.queueing(ctx.guild.id)
+        if job:
+            footer += f" | Resolving playlist: {job.resolved}/{job.total}"
+        elif lazy:
+            footer += f" | {len(lazy)} resolved as they come up"
+        embed.set_footer(text=footer)
         await ctx.send(embed=embed)
 
     @commands.command(aliases=["resume"])
@@ -272,6 +424,10 @@ class Music(commands.Cog):
             return await ctx.send("Nothing playing.")
 
         player.shuffle = not player.shuffle
+        lazy = self.lazy.get(ctx.guild.id)
+        if lazy is not None:
+            # Lavalink only picks at random from the tracks that are already resolved.
+            lazy.shuffle(player.shuffle)
         await ctx.send("🔀 | Shuffle " + ("enabled" if player.shuffle else "disabled"))
 
     @commands.command(aliases=["loop"])
@@ -289,16 +445,22 @@ class Music(commands.Cog):
     async def remove(self, ctx, index: int):
         """ Removes an item from the player"s queue with the given index. """
         player = self.bot.lavalink.players.get(ctx.guild.id)
+        lazy = self.pending(ctx.guild.id)
+        total = len(player.queue) + (len(lazy) if lazy else 0)
 
-        if not player.queue:
+        if not total:
             return await ctx.send("Nothing queued.")
 
-        if index > len(player.queue) or index < 1:
-            return await ctx.send(f"Index has to be **between** 1 and {len(player.queue)}")
+        if index > total or index < 1:
+            return await ctx.send(f"Index has to be **between** 1 and {total}")
 
-        removed = player.queue.pop(index - 1)  # Account for 0-index.
+        if index <= len(player.queue):
+            title = player.queue.pop(index - 1).title  # Account for 0-index.
+        else:
+            removed = lazy.remove(index - len(player.queue) - 1)
+            title = removed.name if isinstance(removed, audio.SpotifyTrack) else removed.track["info"]["title"]
 
-        await ctx.send(f"Removed **{removed.title}** from the queue.")
+        await ctx.send(f"Removed **{title}** from the queue.")
 
     @commands.command()
     async def find(self, ctx, *, query):
@@ -308,7 +470,7 @@ class Music(commands.Cog):
         if not query.startswith("ytsearch:") and not query.startswith("scsearch:"):
             query = "ytsearch:" + query
 
-        results = await player.node.get_tracks(query)
+        results = await self.bot.searches.get_tracks(player.node, query)
 
         if not results or not results["tracks"]:
             return await ctx.send("Nothing found.")
@@ -336,29 +498,128 @@ class Music(commands.Cog):
             return await ctx.send("You're not in my voicechannel!")
 
         player.queue.clear()
+        self.cancel_queueing(ctx.guild.id)
         await player.stop()
-        try:
-            self.task.cancel()
-        except Exception:
-            pass
         await self.connect_to(ctx.guild.id, None)
         await ctx.send("*⃣ | Disconnected.")
 
+    @commands.group(aliases=["pl"], invoke_without_command=True)
+    async def playlist(self, ctx):
+        """ Saves the queue as a playlist of your own, to be loaded again later. """
+        await ctx.send_help(ctx.command)
+
+    @playlist.command(name="save")
+    async def playlist_save(self, ctx, *, name: str):
+        """ Saves the current track and the queue under the given name, replacing a playlist of the same name. """
+        player = self.bot.lavalink.players.get(ctx.guild.id)
+        tracks = ([audio.track_data(player.current)] if player.current else []) + \
+            [audio.track_data(track) for track in player.queue]
+
+        lazy = self.pending(ctx.guild.id)
+        waiting = list(lazy.entries) if lazy is not None else []
+
+        limit = self.bot.config.get("playlist_max_tracks", 1000)
+        if not tracks and not waiting:
+            return await ctx.send("Nothing queued.")
+        if len(tracks) + len(waiting) > limit:
+            # Checked before resolving anything, so an oversized lazy queue never costs a single search.
+            return await ctx.send(f"Playlists can hold at most {limit} tracks.")
+
+        if waiting:
+            async with ctx.typing():
+                # Saved playlists hold resolved tracks only, so resolve whatever is still waiting once, now.
+                tracks += [track for track in await lazy.resolve(waiting) if track is not None]
+            if not tracks:
+                return await ctx.send("Nothing found!")
+
+        async with self.bot.db.acquire() as conn:
+            async with conn.transaction():
+                playlist_id = await conn.fetchval("INSERT INTO playlists (guild_id, user_id, name) "
+                                                  "VALUES ($1, $2, $3) ON CONFLICT (guild_id, user_id, name) "
+                                                  "DO UPDATE SET saved_at=now() RETURNING id",
+                                                  ctx.guild.id, ctx.author.id, name)
+                await conn.execute("DELETE FROM playlist_tracks WHERE playlist_id=$1", playlist_id)
+                await conn.executemany("INSERT INTO playlist_tracks (playlist_id, position, track, info) "
+                                       "VALUES ($1, $2, $3, $4::jsonb)",
+                                       [(playlist_id, position, track["track"], json.dumps(track["info"]))
+                                        for position, track in enumerate(tracks)])
+
+        await ctx.send(f"💾 | Saved **{len(tracks)}** tracks as **{name}**.")
+
+    @playlist.command(name="load")
+    async def playlist_load(self, ctx, *, name: str):
+        """ Queues one of your saved playlists. """
+        player = self.bot.lavalink.players.get(ctx.guild.id)
+        player.store("context", ctx)
+
+        rows = await self.bot.db.fetch("SELECT t.track, t.info FROM playlist_tracks t "
+                                       "JOIN playlists p ON p.id = t.playlist_id "
+                                       "WHERE p.guild_id=$1 AND p.user_id=$2 AND p.name=$3 ORDER BY t.position",
+                                       ctx.guild.id, ctx.author.id, name)
+        if not rows:
+            return await ctx.send(f"You have no playlist called **{name}**.")
+
+        tracks = [{"track": row["track"], "info": json.loads(row["info"])} for row in rows]
+        lazy = self.pending(ctx.guild.id)
+        if lazy is not None:
+            for track in tracks:
+                lazy.add(track, ctx.author.id)
+        else:
+            player.queue.extend(lavalink.AudioTrack.build(track, ctx.author.id) for track in tracks)
+
+        embed = discord.Embed(color=discord.Color.blurple(), title="Playlist Enqueued!",
+                              description=f"{name} - {len(tracks)} tracks")
+        await ctx.send(embed=embed)
+
+        if not player.is_playing:
+            await player.play()
+
+    @playlist.command(name="list")
+    async def playlist_list(self, ctx):
+        """ Lists your saved playlists. """
+        rows = await self.bot.db.fetch("SELECT p.name, count(t.position) AS tracks FROM playlists p "
+                                       "LEFT JOIN playlist_tracks t ON t.playlist_id = p.id "
+                                       "WHERE p.guild_id=$1 AND p.user_id=$2 GROUP BY p.id ORDER BY p.name",
+                                       ctx.guild.id, ctx.author.id)
+        if not rows:
+            return await ctx.send("You have no saved playlists.")
+
+        description = "\n".join(f"**{row['name']}** - {row['tracks']} tracks" for row in rows)
+        await ctx.send(embed=discord.Embed(color=discord.Color.blurple(), title="Your Playlists",
+                                           description=description))
+
+    @playlist.command(name="delete", aliases=["remove"])
+    async def playlist_delete(self, ctx, *, name: str):
+        """ Deletes one of your saved playlists. """
+        deleted = await self.bot.db.fetchval("DELETE FROM playlists WHERE guild_id=$1 AND user_id=$2 AND name=$3 "
+                                             "RETURNING id", ctx.guild.id, ctx.author.id, name)
+        if deleted is None:
+            return await ctx.send(f"You have no playlist called **{name}**.")
+
+        await ctx.send(f"🗑 | Deleted **{name}**.")
+
     @commands.command(aliases=["join", "connect"])
     async def summon(self, ctx):
         await self.connect_to(ctx.guild.id, str(ctx.author.voice.channel.id))
 
     async def ensure_voice(self, ctx):
         """ This check ensures that the bot and command author are in the same voicechannel. """
-        player = self.bot.lavalink.players.create(ctx.guild.id, endpoint=str(ctx.guild.region))
-        # Create returns a player if one exists, otherwise creates.
-
-        should_connect = ctx.command.name in ("play", "summon",)  # Add commands that require joining voice to work.
+        should_connect = ctx.command.qualified_name in ("play", "summon", "playlist load")
+        # Add commands that require joining voice to work.
+
+        if should_connect:
+            region = str(ctx.guild.region)
+            player = self.bot.lavalink.players.create(ctx.guild.id, endpoint=region, node=self.bot.nodes.best(region))
+            # Create returns a player if one exists, otherwise creates.
+            player.store("region", region)
+        else:
+            # Anything else only makes sense in a guild that is already playing; don't allocate a player for it.
+            player = self.bot.lavalink.players.get(ctx.guild.id)
 
         if not ctx.author.voice or not ctx.author.voice.channel:
             raise commands.CommandInvokeError("Join a voice channel first.")
 
-        if not player.is_connected:
+        if player is None or not player.is_connected:
             if not should_connect:
                 raise commands.CommandInvokeError("Not connected.")
 
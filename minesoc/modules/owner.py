@@ -4,6 +4,8 @@ import discord
 import asyncpg
 from discord.ext import commands
 
+from minesoc.utils.nodes import penalty
+
 
 class Owner(commands.Cog):
 
@@ -27,12 +29,14 @@ class Owner(commands.Cog):
             await self.bot.db.execute("INSERT INTO user_blacklist (id, reason) VALUES ($1, $2)", id, reason)
         else:
             await self.bot.db.execute("INSERT INTO guild_blacklist (id, reason) VALUES ($1, $2)", id, reason)
+        self.bot.blacklist.add(id, table)
 
     async def remove_blacklist(self, id, table):
         if table == "user_blacklist":
             await self.bot.db.execute("DELETE FROM user_blacklist WHERE id=$1", id)
         else:
             await self.bot.db.execute("DELETE FROM guild_blacklist WHERE id=$1", id)
+        self.bot.blacklist.remove(id, table)
 
     async def get_blacklist_entry(self, id, table):
         if table == "user_blacklist":
@@ -91,6 +95,58 @@ class Owner(commands.Cog):
         else:
             await ctx.message.add_reaction("👌")
 
+    @commands.command()
+    async def stages(self, ctx: commands.Context):
+        """Per-stage timings of the message pipeline"""
+        lines = [f"{'stage':<10} {'calls':>9} {'avg ms':>8} {'max ms':>8} {'errors':>6}"]
+        for stage in self.bot.pipeline.stats:
+            lines.append(f"{stage.name:<10} {stage.calls:>9} {stage.average_ms:>8.3f} {stage.max_ms:>8.3f} "
+                         f"{stage.errors:>6}")
+
+        await ctx.send("```\n" + "\n".join(lines) + "\n```")
+
+    @commands.command()
+    async def caches(self, ctx: commands.Context):
+        """Hit rates and sizes of the in-memory caches"""
+        caches = {"cards": self.bot.render.cards, "avatars": self.bot.api.avatars.cache,
+                  "covers": self.bot.api.covers.cache, "searches": self.bot.searches.cache}
+
+        lines = [f"{'cache':<10} {'items':>7} {'hits':>9} {'misses':>9} {'rate':>6}"]
+        for name, cache in caches.items():
+            lines.append(f"{name:<10} {len(cache):>7} {cache.hits:>9} {cache.misses:>9} {cache.hit_rate:>6.1%}")
+
+        searches = self.bot.searches
+        lines.append(f"\nLavalink searches average {searches.average_latency * 1000:.0f}ms; "
+                     f"cache hits saved about {searches.saved:.1f}s.")
+        known = self.bot.spotify_tracks
+        lines.append(f"Spotify tracks: {known.hits} already resolved, {known.misses} searched.")
+
+        await ctx.send("```\n" + "\n".join(lines) + "\n```")
+
+    @commands.command()
+    async def nodes(self, ctx: commands.Context):
+        """Load and health of the Lavalink nodes"""
+        pool = getattr(self.bot, "nodes", None)
+        if pool is None:
+            return await ctx.error(description="The music module has not been loaded.")
+
+        lines = [f"{'node':<12} {'region':<8} {'players':>7} {'cpu':>5} {'deficit':>7} {'penalty':>8} healthy"]
+        for node in pool.nodes:
+            stats = node.stats
+            cpu = f"{stats.system_load:.0%}" if stats is not None else "-"
+            deficit = stats.frames_deficit if stats is not None else "-"
+            players = sum(1 for player in pool.players if player.node is node)
+            lines.append(f"{node.name:<12} {node.region or '-':<8} {players:>7} {cpu:>5} {deficit:>7} "
+                         f"{penalty(node):>8.1f} {'yes' if pool.healthy(node) else 'no'}")
+        lines.append(f"\n{pool.moved} players moved off unhealthy nodes.")
+
+        music = self.bot.get_cog("Music")
+        if music is not None:
+            players, tracks = music.resident()
+            lines.append(f"{players} players resident with {tracks} queued tracks; {music.reaped} idle players reaped.")
+
+        await ctx.send("```\n" + "\n".join(lines) + "\n```")
+
     @commands.group(invoke_without_command=True)
     async def blacklist(self, ctx: commands.Context):
         """Punish naughty people"""
@@ -1,12 +1,15 @@
 # status.py
 # This extension contains commands relating to Minecraft queries
 import asyncio
+import io
 from datetime import datetime
 
-import aiohttp.client
 import discord
 from discord.ext import commands
 
+from minesoc.utils import checks
+from minesoc.utils.minecraft import MinecraftError, Query
+
 
 class Minecraft(commands.Cog, name="Minecraft"):
     """Minecraft related commands"""
@@ -14,48 +17,155 @@ class Minecraft(commands.Cog, name="Minecraft"):
     def __init__(self, bot):
         self.bot = bot
 
+    def status_embed(self, address, status, query=None):
+        """Builds the status embed, and the favicon to attach to it if the server has one."""
+        embed = discord.Embed(title=address, colour=self.bot.colors.green, description=status.motd or None,
+                              timestamp=datetime.utcnow())
+        embed.add_field(name="Version", value=f"{self.bot.custom_emojis.minecraft} {status.version}")
+        embed.add_field(name="Players", value=f"{status.online}/{status.max}")
+        if status.latency is not None:
+            embed.add_field(name="Latency", value=f"{status.latency:.0f}ms")
+
+        names = query.players if query is not None else status.players
+        if names:
+            embed.add_field(name="Online", value=", ".join(names)[:1024], inline=False)
+        if query is not None and query.plugins:
+            embed.add_field(name=f"Plugins ({query.software})", value=", ".join(query.plugins)[:1024], inline=False)
+
+        file = None
+        if status.favicon:
+            file = discord.File(io.BytesIO(status.favicon), filename="favicon.png")
+            embed.set_thumbnail(url="attachment://favicon.png")
+        return embed, file
+
     # Commands
-    @commands.command(name="query", help="Queries a MC server. Only works if server has enable-query set to true")
+    @commands.command(name="query", help="Queries a MC server. Players and plugins are only listed if the server has "
+                                         "enable-query set to true")
     @commands.cooldown(1, 10, type=commands.BucketType.user)
     async def query(self, ctx, address: str):
         """
         Queries a specified Minecraft server gaining detailed information of the server.
         """
-        msg = await ctx.send(embed=discord.Embed(title=f"{self.bot.custom_emojis.typing} Querying {address}",
-                                                 color=self.bot.colors.neutral))
-
         async with ctx.typing():
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"https://eu.mc-api.net/v3/server/ping/{address}") as r:
-                    try:
-                        res = await r.json()
-                    except:
-                        embed = discord.Embed(title="An unexpected error has occurred.", colour=self.bot.colors.red)
-                    finally:
-                        await session.close()
-            online = res["online"]
-            if online:
-                favicon = res["favicon"]
-                try:
-                    motd = res["description"]["text"]
-                except TypeError:
-                    motd = res["description"]
-                players = f"{res['players']['online']}/{res['players']['max']}"
-                version = res["version"]["name"]
-                timestamp = datetime.strptime(res["fetch"], "%Y-%m-%dT%H:%M:%S.%fZ")
-                embed = discord.Embed(title=address, colour=self.bot.colors.green,
-                                      description=motd, timestamp=timestamp)
-                embed.set_footer(icon_url=ctx.author.avatar_url, text=ctx.author.name)
-                embed.set_thumbnail(url=favicon)
-                embed.add_field(name="Version", value=f"{self.bot.custom_emojis.minecraft} {version}")
-                embed.add_field(name="Players", value=players)
+            try:
+                target = await self.bot.minecraft.resolve(address)  # One SRV lookup shared by both protocols.
+            except MinecraftError as e:
+                status, query = e, None
             else:
-                embed = discord.Embed(title=f"{address} may be offline or invalid", colour=self.bot.colors.neutral)
+                status, query = await asyncio.gather(self.bot.minecraft.status(address, target),
+                                                     self.bot.minecraft.full_stat(address, target),
+                                                     return_exceptions=True)
+
+        if isinstance(status, MinecraftError):
+            return await ctx.send(embed=discord.Embed(title=f"{address} may be offline or invalid",
+                                                      colour=self.bot.colors.neutral))
+        if isinstance(status, Exception):
+            raise status
+
+        embed, file = self.status_embed(address, status, query if isinstance(query, Query) else None)
+        embed.set_footer(icon_url=ctx.author.avatar_url, text=ctx.author.name)
+        await ctx.send(embed=embed, file=file)
+
+    @commands.command(name="servers", help="Queries up to 20 MC servers at once")
+    @commands.cooldown(1, 30, type=commands.BucketType.user)
+    async def servers(self, ctx, *addresses: str):
+        """
+        Pings several Minecraft servers concurrently and summarises them in one embed.
+        """
+        addresses = list(dict.fromkeys(addresses))  # Drop duplicates, keep order.
+        limit = self.bot.config.get("bulk_query_limit", 20)
+        if not addresses:
+            return await ctx.send("Please enter at least one server address.")
+        if len(addresses) > limit:
+            return await ctx.send(f"Please enter at most {limit} server addresses.")
+
+        async with ctx.typing():
+            statuses = await self.bot.minecraft.status_many(
+                addresses, concurrency=self.bot.config.get("bulk_query_concurrency", 8))
 
-        await asyncio.sleep(2.5)
-        await msg.delete()
+        embed = discord.Embed(title=f"{len(addresses)} servers", colour=self.bot.colors.neutral,
+                              description="\n".join(self.status_line(address, status)
+                                                    for address, status in zip(addresses, statuses)),
+                              timestamp=datetime.utcnow())
+        embed.set_footer(icon_url=ctx.author.avatar_url, text=ctx.author.name)
         await ctx.send(embed=embed)
 
+    @staticmethod
+    def status_line(address, status):
+        if status is None or isinstance(status, MinecraftError):
+            return f"🔴 **{address}** - offline"
+        return f"🟢 **{address}** - {status.online}/{status.max} players, {status.version}"
+
+    @commands.group(invoke_without_command=True)
+    @commands.guild_only()
+    async def watch(self, ctx):
+        """Servers this guild keeps an eye on, refreshed in the background"""
+        await ctx.invoke(self.watch_status)
+
+    @watch.command(name="add")
+    @checks.is_owner_or_has_permissions(manage_guild=True)
+    async def watch_add(self, ctx, address: str):
+        """Adds a server to the watchlist"""
+        if len(self.bot.watchlist.watched(ctx.guild.id)) >= self.bot.config.get("watch_limit", 25):
+            return await ctx.error(description="This guild is already watching as many servers as it can.")
+
+        async with ctx.typing():
+            try:
+                address = await self.bot.watchlist.add(ctx.guild.id, address, ctx.author.id)
+            except MinecraftError as e:
+                return await ctx.error(description=f"`{address}` can't be watched: it {e.message}.")
+        await ctx.send(f"Now watching **{address}**.")
+
+    @watch.command(name="remove")
+    @checks.is_owner_or_has_permissions(manage_guild=True)
+    async def watch_remove(self, ctx, address: str):
+        """Removes a server from the watchlist"""
+        if not await self.bot.watchlist.remove(ctx.guild.id, address):
+            return await ctx.error(description=f"`{address}` is not being watched.")
+        await ctx.send(f"Stopped watching **{address}**.")
+
+    @watch.command(name="list")
+    async def watch_list(self, ctx):
+        """Lists the watched servers"""
+        addresses = self.bot.watchlist.watched(ctx.guild.id)
+        if not addresses:
+            return await ctx.send("No servers are being watched.")
+        await ctx.send(embed=discord.Embed(title="Watched servers", colour=self.bot.colors.neutral,
+                                           description="\n".join(addresses)))
+
+    @watch.command(name="status")
+    async def watch_status(self, ctx, address: str = None):
+        """Last known status of every watched server, or the full status of one"""
+        watchlist = self.bot.watchlist
+        addresses = watchlist.watched(ctx.guild.id)
+        if not addresses:
+            return await ctx.send("No servers are being watched.")
+
+        if address is None:
+            lines = [self.status_line(a, watchlist.results[a].status if a in watchlist.results else None)
+                     for a in addresses]
+            checked = [watchlist.results[a].checked_at for a in addresses if a in watchlist.results]
+            embed = discord.Embed(title="Watched servers", colour=self.bot.colors.neutral, description="\n".join(lines))
+            if checked:
+                embed.timestamp = min(checked)
+                embed.set_footer(text="Checked")
+            return await ctx.send(embed=embed)
+
+        key = address.strip().lower()
+        if key not in addresses:
+            return await ctx.error(description=f"`{address}` is not being watched.")
+
+        poll = watchlist.results.get(key)
+        if poll is None:
+            return await ctx.send(f"{address} has not been checked yet.")
+        if poll.status is None:
+            return await ctx.send(embed=discord.Embed(title=f"{address} may be offline or invalid",
+                                                      colour=self.bot.colors.neutral, timestamp=poll.checked_at))
+
+        embed, file = self.status_embed(address, poll.status)
+        embed.timestamp = poll.checked_at
+        await ctx.send(embed=embed, file=file)
+
     @query.error
     async def query_error(self, ctx, error):
         if isinstance(error, commands.MissingRequiredArgument):
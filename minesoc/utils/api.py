@@ -1,13 +1,61 @@
+import asyncio
 import re
 import aiohttp
 import discord
 
+from minesoc.utils import cache, images, spotify
+
 
 class API:
     def __init__(self, bot):
+        self.bot = bot
         self.session = aiohttp.ClientSession()
         self.animal = Animal(self.session)
-        self.bot = bot
+        self.avatars = AssetCache(self.session, maxsize=bot.config.get("avatar_cache_size", 512),
+                                  transform=images.fit_avatar)
+        self.covers = AssetCache(self.session, maxsize=bot.config.get("cover_cache_size", 1024),
+                                 ttl=bot.config.get("cover_cache_ttl", 6 * 3600), transform=images.fit_cover)
+        self.spotify = spotify.SpotifyClient(self.session, bot.config.get("spotify_id"),
+                                             bot.config.get("spotify_secret"))
+
+
+class AssetCache:
+    """
+    Downloads images over a shared session and keeps the (transformed) bytes in an LRU keyed by URL.
+
+    Concurrent requests for the same URL share a single download.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, maxsize=512, ttl=None, transform=None):
+        self.session = session
+        self.cache = cache.TTLCache(maxsize=maxsize, ttl=ttl) if ttl else cache.LRUCache(maxsize=maxsize)
+        self.transform = transform
+        self._inflight = {}
+
+    async def fetch(self, url):
+        asset = self.cache.get(url)
+        if asset is not None:
+            return asset
+
+        task = self._inflight.get(url)
+        if task is None:
+            task = self._inflight[url] = asyncio.ensure_future(self._download(url))
+            task.add_done_callback(lambda _: self._inflight.pop(url, None))
+
+        # Shielded so one cancelled caller doesn't cancel the download for everyone else waiting on it.
+        return await asyncio.shield(task)
+
+    async def _download(self, url):
+        async with self.session.get(url) as r:
+            if r.status != 200:
+                return None
+            data = await r.read()
+
+        if self.transform is not None:
+            data = await asyncio.get_event_loop().run_in_executor(None, self.transform, data)
+
+        self.cache.set(url, data)
+        return data
 
 
 class Animal:
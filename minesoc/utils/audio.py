@@ -0,0 +1,415 @@
+import asyncio
+import json
+import random
+import time
+from collections import namedtuple
+
+from minesoc.utils import cache
+
+SEARCH_PREFIXES = ("ytsearch", "scsearch")
+
+ResolvedTrack = namedtuple("ResolvedTrack", "track requester")
+
+
+def track_data(track):
+    """The Lavalink payload (encoded track plus info) of an `AudioTrack`, which only keeps the info as attributes."""
+    return {"track": track.track,
+            "info": {"identifier": track.identifier, "isSeekable": track.is_seekable, "author": track.author,
+                     "length": track.duration, "isStream": track.stream, "position": 0, "title": track.title,
+                     "uri": track.uri}}
+
+
+class SpotifyTrack(namedtuple("SpotifyTrack", "id name artist requester")):
+    """The part of a Spotify track object needed to find it on Lavalink. Local files have no ID."""
+    __slots__ = ()
+
+    @classmethod
+    def from_api(cls, track, requester=None):
+        artists = track.get("artists") or [{"name": ""}]
+        return cls(track.get("id"), track["name"], artists[0]["name"], requester)
+
+    @property
+    def query(self):
+        return f"ytsearch:{self.name} {self.artist} lyrics"
+
+    @property
+    def url(self):
+        return f"https://open.spotify.com/track/{self.id}" if self.id else None
+
+
+def normalize_query(query):
+    """Searches are compared case- and whitespace-insensitively; URLs are left as they are."""
+    prefix, sep, terms = query.strip().partition(":")
+    if sep and prefix in SEARCH_PREFIXES:
+        return f"{prefix}:{' '.join(terms.lower().split())}"
+    return query.strip()
+
+
+class SearchCache:
+    """
+    Lavalink search results shared by every guild, keyed by normalized query.
+
+    With `persist` set, results are also written to the search_cache table and loaded back on startup. Rows older
+    than `ttl` are deleted on startup and then about once per `ttl` while results keep being stored.
+    """
+
+    def __init__(self, bot, maxsize=5000, ttl=86400, persist=False):
+        self.bot = bot
+        self.ttl = ttl
+        self.persist = persist
+        self.cache = cache.TTLCache(maxsize=maxsize, ttl=ttl)
+        self.searches = 0
+        self.search_time = 0.0
+        self.saved = 0.0
+        self._inflight = {}
+        self._pruned = 0.0
+
+    @property
+    def average_latency(self):
+        return self.search_time / self.searches if self.searches else 0.0
+
+    async def load(self):
+        if not self.persist:
+            return 0
+
+        await self.prune()
+        rows = await self.bot.db.fetch("SELECT query, result, extract(epoch FROM now() - cached_at)::float8 AS age "
+                                       "FROM search_cache WHERE cached_at > now() - make_interval(secs => $1) "
+                                       "ORDER BY cached_at DESC LIMIT $2", self.ttl, self.cache.maxsize)
+        for row in reversed(rows):
+            self.cache.set(row["query"], json.loads(row["result"]), ttl=self.ttl - float(row["age"]))
+        return len(rows)
+
+    async def prune(self):
+        """Deletes persisted results that have expired."""
+        self._pruned = time.monotonic()
+        await self.bot.db.execute("DELETE FROM search_cache WHERE cached_at <= now() - make_interval(secs => $1)",
+                                  self.ttl)
+
+    async def _store(self, key, result):
+        try:
+            await self.bot.db.execute("INSERT INTO search_cache (query, result) VALUES ($1, $2::jsonb) "
+                                      "ON CONFLICT (query) DO UPDATE SET result=EXCLUDED.result, cached_at=now()",
+                                      key, json.dumps(result))
+            if time.monotonic() - self._pruned >= self.ttl:
+                await self.prune()
+        except Exception as e:
+            self.bot.logger.warning("Could not persist a search result.", exc_info=e)
+
+    async def _search(self, node, query, key):
+        start = time.monotonic()
+        result = await node.get_tracks(query)
+        self.search_time += time.monotonic() - start
+        self.searches += 1
+
+        if result and result.get("tracks"):
+            self.cache.set(key, result)
+            if self.persist:
+                asyncio.ensure_future(self._store(key, result))
+        return result
+
+    async def get_tracks(self, node, query):
+        key = normalize_query(query)
+        result = self.cache.get(key)
+        if result is not None:
+            self.saved += self.average_latency
+            return result
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(self._search(node, query, key))
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        return await asyncio.shield(task)
+
+
+async def search(node, searches, track: SpotifyTrack):
+    if track.id is None:
+        return None
+
+    result = await searches.get_tracks(node, track.query)
+    return result["tracks"][0] if result and result["tracks"] else None
+
+
+class SpotifyTrackMap:
+    """
+    Remembers which Lavalink track each Spotify track ID resolved to, so replaying it needs no search.
+
+    Entries older than `stale_after` seconds are still served, but are searched again in the background.
+    """
+
+    def __init__(self, bot, stale_after=2592000, concurrency=2):
+        self.bot = bot
+        self.stale_after = stale_after
+        self.concurrency = concurrency
+        self.hits = 0
+        self.misses = 0
+        self._revalidating = set()
+
+    async def lookup(self, node, tracks):
+        """Returns a dict of Spotify ID -> Lavalink track for the given Spotify tracks that are already known."""
+        ids = list({track.id for track in tracks if track.id})
+        if not ids:
+            return {}
+
+        try:
+            rows = await self.bot.db.fetch("SELECT spotify_id, track, info, "
+                                           "resolved_at < now() - make_interval(secs => $2) AS stale "
+                                           "FROM spotify_tracks WHERE spotify_id = ANY($1::text[])",
+                                           ids, self.stale_after)
+        except Exception as e:
+            self.bot.logger.warning("Could not look up resolved Spotify tracks.", exc_info=e)
+            return {}
+
+        known = {row["spotify_id"]: {"track": row["track"], "info": json.loads(row["info"])} for row in rows}
+        self.hits += len(known)
+        self.misses += len(ids) - len(known)
+
+        stale = {row["spotify_id"] for row in rows if row["stale"]}
+        if stale:
+            self.revalidate(node, [track for track in tracks if track.id in stale])
+        return known
+
+    async def store(self, resolved):
+        """Saves (Spotify ID, Lavalink track) pairs."""
+        if not resolved:
+            return
+
+        try:
+            await self.bot.db.executemany("INSERT INTO spotify_tracks (spotify_id, track, info) "
+                                          "VALUES ($1, $2, $3::jsonb) ON CONFLICT (spotify_id) DO UPDATE "
+                                          "SET track=EXCLUDED.track, info=EXCLUDED.info, resolved_at=now()",
+                                          [(sid, track["track"], json.dumps(track["info"])) for sid, track in resolved])
+        except Exception as e:
+            self.bot.logger.warning("Could not save resolved Spotify tracks.", exc_info=e)
+
+    def revalidate(self, node, tracks):
+        tracks = [track for track in tracks if track.id not in self._revalidating]
+        if tracks:
+            self._revalidating.update(track.id for track in tracks)
+            asyncio.ensure_future(self._revalidate(node, tracks))
+
+    async def _revalidate(self, node, tracks):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        resolved, missing = [], []
+
+        async def check(track):
+            async with semaphore:
+                # Straight to the node: a cached result would just confirm the stale entry.
+                result = await node.get_tracks(track.query)
+            if result and result.get("tracks"):
+                resolved.append((track.id, result["tracks"][0]))
+            elif result and result.get("loadType") == "NO_MATCHES":
+                missing.append(track.id)
+
+        try:
+            await asyncio.gather(*[check(track) for track in tracks], return_exceptions=True)
+            await self.store(resolved)
+            if missing:
+                await self.bot.db.execute("DELETE FROM spotify_tracks WHERE spotify_id = ANY($1::text[])", missing)
+        except Exception as e:
+            self.bot.logger.warning("Could not revalidate stale Spotify tracks.", exc_info=e)
+        finally:
+            self._revalidating.difference_update(track.id for track in tracks)
+
+
+class ResolveJob:
+    """
+    Resolves Spotify tracks to Lavalink tracks with a bounded number of concurrent searches.
+
+    Searches finish in any order, but tracks are added to the player in playlist order, and playback starts as soon
+    as the first one is in the queue. A job started while another is still running for the same guild waits for
+    that one to finish queueing before adding its own tracks.
+    """
+
+    def __init__(self, player, tracks, requester, searches: SearchCache, known: SpotifyTrackMap, concurrency=5,
+                 previous=None):
+        self.player = player
+        self.tracks = [SpotifyTrack.from_api(track, requester) for track in tracks]
+        self.requester = requester
+        self.searches = searches
+        self.known = known
+        self.concurrency = concurrency
+        self.previous = previous
+        self.resolved = 0
+        self.queued = 0
+        self.failed = 0
+        self.task = None
+
+    @property
+    def total(self):
+        return len(self.tracks)
+
+    @property
+    def done(self):
+        return self.task is not None and self.task.done()
+
+    def start(self):
+        self.task = asyncio.ensure_future(self.run())
+        return self.task
+
+    def cancel(self):
+        if self.previous is not None:
+            self.previous.cancel()
+        if self.task is not None:
+            self.task.cancel()
+
+    async def search(self, track):
+        return await search(self.player.node, self.searches, track)
+
+    async def _work(self, indexes, futures, resolved):
+        for index in indexes:
+            track = self.tracks[index]
+            try:
+                result = await self.search(track)
+            except Exception:
+                result = None
+            self.resolved += 1
+            if result is not None:
+                resolved.append((track.id, result))
+            futures[index].set_result(result)
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        futures = [loop.create_future() for _ in self.tracks]
+
+        known = await self.known.lookup(self.player.node, self.tracks)
+
+        pending = []
+        for index, track in enumerate(self.tracks):
+            if track.id in known:
+                futures[index].set_result(known[track.id])
+                self.resolved += 1
+            else:
+                pending.append(index)
+
+        # Workers share one iterator, so each index is searched exactly once.
+        indexes = iter(pending)
+        resolved = []
+        workers = [loop.create_task(self._work(indexes, futures, resolved))
+                   for _ in range(min(self.concurrency, len(pending)))]
+
+        try:
+            if self.previous is not None and self.previous.task is not None:
+                await asyncio.wait([self.previous.task])
+            # Once it has finished queueing there is nothing left to wait for; don't keep the whole chain alive.
+            self.previous = None
+
+            for future in futures:
+                track = await future
+                if track is None:
+                    self.failed += 1
+                    continue
+
+                self.player.add(requester=self.requester, track=track)
+                self.queued += 1
+                if not self.player.is_playing:
+                    await self.player.play()
+        finally:
+            self.previous = None
+            for worker in workers:
+                worker.cancel()
+            asyncio.ensure_future(self.known.store(resolved))
+
+
+class LazyQueue:
+    """
+    Tracks waiting behind a player's own queue without being resolved yet.
+
+    Entries are either `SpotifyTrack`s or `ResolvedTrack`s queued after them, so playback order is kept. `fill` moves
+    entries into the player's queue only until it holds `ahead` tracks, so a long playlist that is stopped early is
+    never searched in full.
+
+    While `shuffled` is set (the player is shuffling), entries added later land at random positions as well, so
+    Lavalink's shuffle, which only sees resolved tracks, still covers the whole playlist.
+    """
+
+    def __init__(self, player, searches: SearchCache, known: SpotifyTrackMap, ahead=3, concurrency=3,
+                 shuffled=False):
+        self.player = player
+        self.searches = searches
+        self.known = known
+        self.ahead = ahead
+        self.concurrency = concurrency
+        self.entries = []
+        self.shuffled = shuffled
+        self.failed = 0
+        self._lock = asyncio.Lock()
+        self._generation = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __bool__(self):
+        return bool(self.entries)
+
+    def extend(self, tracks, requester):
+        self.entries.extend(SpotifyTrack.from_api(track, requester) for track in tracks)
+        if self.shuffled:
+            # The waiting entries are already in random order, so shuffling them together is the same as inserting
+            # each new one at a random position, without the quadratic inserts.
+            random.shuffle(self.entries)
+
+    def add(self, track, requester):
+        entry = ResolvedTrack(track, requester)
+        if self.shuffled:
+            self.entries.insert(random.randint(0, len(self.entries)), entry)
+        else:
+            self.entries.append(entry)
+
+    def remove(self, index):
+        return self.entries.pop(index)
+
+    def shuffle(self, enabled=True):
+        self.shuffled = enabled
+        if enabled:
+            random.shuffle(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+        self._generation += 1  # Drops a batch that is being resolved right now.
+
+    async def resolve(self, batch):
+        known = await self.known.lookup(self.player.node, [e for e in batch if isinstance(e, SpotifyTrack)])
+        semaphore = asyncio.Semaphore(self.concurrency)
+        resolved = []
+
+        async def resolve(entry):
+            if isinstance(entry, ResolvedTrack):
+                return entry.track
+            if entry.id in known:
+                return known[entry.id]
+
+            async with semaphore:
+                try:
+                    track = await search(self.player.node, self.searches, entry)
+                except Exception:
+                    return None
+            if track is not None:
+                resolved.append((entry.id, track))
+            return track
+
+        tracks = await asyncio.gather(*[resolve(entry) for entry in batch])
+        asyncio.ensure_future(self.known.store(resolved))
+        return tracks
+
+    async def fill(self):
+        """Resolves entries into the player's queue until it holds `ahead` tracks. Returns how many were added."""
+        added = 0
+        async with self._lock:
+            while self.entries and len(self.player.queue) < self.ahead:
+                generation = self._generation
+                batch = self.entries[:self.ahead - len(self.player.queue)]
+                del self.entries[:len(batch)]
+
+                tracks = await self.resolve(batch)
+                if generation != self._generation:
+                    break
+
+                for entry, track in zip(batch, tracks):
+                    if track is None:
+                        self.failed += 1
+                        continue
+                    self.player.add(requester=entry.requester, track=track)
+                    added += 1
+        return added
@@ -0,0 +1,37 @@
+import asyncio
+
+
+class Blacklist:
+    """
+    In-memory view of the user and guild blacklist tables.
+    """
+
+    def __init__(self, bot, interval=900):
+        self.bot = bot
+        self.interval = interval
+        self.users = set()
+        self.guilds = set()
+
+    def _set(self, table):
+        return self.users if table == "user_blacklist" else self.guilds
+
+    def add(self, id, table):
+        self._set(table).add(id)
+
+    def remove(self, id, table):
+        self._set(table).discard(id)
+
+    async def load(self):
+        users = {u["id"] for u in await self.bot.db.fetch("SELECT id FROM user_blacklist")}
+        guilds = {g["id"] for g in await self.bot.db.fetch("SELECT id FROM guild_blacklist")}
+        # Swap whole sets so readers never see a half-loaded blacklist.
+        self.users, self.guilds = users, guilds
+
+    async def run(self):
+        # Picks up rows edited outside of the bot's own blacklist commands.
+        while not self.bot.is_closed():
+            await asyncio.sleep(self.interval)
+            try:
+                await self.load()
+            except Exception as e:
+                self.bot.logger.warning("Blacklist could not be reconciled.", exc_info=e)
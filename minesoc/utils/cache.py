@@ -0,0 +1,112 @@
+import time
+from collections import OrderedDict
+
+MISSING = object()
+
+
+class LRUCache:
+    """
+    A bounded mapping that evicts the least recently used key once it holds more than `maxsize` items.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        value = self._data.get(key, MISSING)
+        if value is MISSING:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        return self._data.pop(key, default)
+
+    def clear(self):
+        self._data.clear()
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class SizedLRUCache(LRUCache):
+    """
+    An LRUCache bounded by the total len() of its values, for caches of encoded bytes.
+    """
+
+    def __init__(self, maxbytes):
+        super().__init__(maxsize=None)
+        self.maxbytes = maxbytes
+        self.size = 0
+
+    def set(self, key, value):
+        if len(value) > self.maxbytes:
+            return
+
+        self.pop(key)
+        self._data[key] = value
+        self.size += len(value)
+        while self.size > self.maxbytes:
+            _, evicted = self._data.popitem(last=False)
+            self.size -= len(evicted)
+
+    def pop(self, key, default=None):
+        value = self._data.pop(key, MISSING)
+        if value is MISSING:
+            return default
+
+        self.size -= len(value)
+        return value
+
+    def clear(self):
+        super().clear()
+        self.size = 0
+
+
+class TTLCache(LRUCache):
+    """
+    An LRUCache whose entries also expire `ttl` seconds after they were set.
+    """
+
+    def __init__(self, maxsize=1024, ttl=3600):
+        super().__init__(maxsize=maxsize)
+        self.ttl = ttl
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        self._data.move_to_end(key)
+        return item[1]
+
+    def set(self, key, value, ttl=None):
+        super().set(key, (time.monotonic() + (self.ttl if ttl is None else ttl), value))
+
+    def pop(self, key, default=None):
+        item = self._data.pop(key, None)
+        return default if item is None else item[1]
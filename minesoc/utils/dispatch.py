@@ -0,0 +1,66 @@
+import time
+
+
+class Stage:
+    __slots__ = ("name", "callback", "priority", "calls", "errors", "total_ns", "max_ns")
+
+    def __init__(self, name, callback, priority):
+        self.name = name
+        self.callback = callback
+        self.priority = priority
+        self.calls = 0
+        self.errors = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def record(self, elapsed):
+        self.calls += 1
+        self.total_ns += elapsed
+        if elapsed > self.max_ns:
+            self.max_ns = elapsed
+
+    @property
+    def average_ms(self):
+        return self.total_ns / self.calls / 1e6 if self.calls else 0.0
+
+    @property
+    def max_ms(self):
+        return self.max_ns / 1e6
+
+
+class MessagePipeline:
+    """
+    Resolves a message's context once and passes it to every registered stage in priority order.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.context = Stage("context", None, 0)
+        self.stages = []
+
+    def add(self, name, callback, priority=50):
+        self.remove(name)
+        self.stages.append(Stage(name, callback, priority))
+        self.stages.sort(key=lambda s: s.priority)
+
+    def remove(self, name):
+        self.stages = [s for s in self.stages if s.name != name]
+
+    async def dispatch(self, message):
+        start = time.perf_counter_ns()
+        ctx = await self.bot.get_context(message)
+        self.context.record(time.perf_counter_ns() - start)
+
+        for stage in self.stages:
+            start = time.perf_counter_ns()
+            try:
+                await stage.callback(ctx)
+            except Exception as e:
+                stage.errors += 1
+                self.bot.logger.error(f"Message stage '{stage.name}' failed.", exc_info=e)
+            finally:
+                stage.record(time.perf_counter_ns() - start)
+
+    @property
+    def stats(self):
+        return [self.context] + self.stages
@@ -7,3 +7,7 @@ class DisabledCommand(CommandError):
 
 class OnlyDevGuild(CommandError):
     pass
+
+
+class RenderBusy(CommandError):
+    pass
@@ -1,7 +1,7 @@
 import textwrap
-import aiohttp
 import datetime
 
+from functools import lru_cache
 from io import BytesIO
 from math import log, floor
 from PIL import Image, ImageDraw, ImageFont, ImageOps
@@ -18,6 +18,37 @@ def human_format(number):
         return "%.2f%s" % (number / k ** magnitude, units[magnitude])
 
 
+BOLD = "arialbd.ttf"
+UNICODE = "arial-unicode-ms.ttf"
+
+_fonts = {}
+
+
+def font(face, size):
+    """Load a (face, size) pair once per process."""
+    loaded = _fonts.get((face, size))
+    if loaded is None:
+        loaded = _fonts[(face, size)] = ImageFont.truetype(face, size)
+    return loaded
+
+
+@lru_cache(maxsize=4096)
+def text_width(face, size, text):
+    return font(face, size).getsize(text)[0]
+
+
+def fit_font_size(face, text, max_width, max_size):
+    """Largest size, at most `max_size`, at which `text` is narrower than `max_width`."""
+    low, high = 1, max_size
+    while low < high:
+        mid = (low + high + 1) // 2
+        if text_width(face, mid, text) < max_width:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
 def seconds_to_hms(seconds):
     seconds = seconds % (24 * 3600)
     hour = seconds // 3600
@@ -29,11 +60,86 @@ def seconds_to_hms(seconds):
     return "%d:%02d:%02d" % (hour, minutes, seconds)
 
 
+class BackgroundStore:
+    """
+    Rank card backgrounds, decoded and fitted to the card size once per process.
+    """
+
+    size = (800, 296)
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._index = None
+        self._fitted = {}
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = {f.stem: f for f in sorted(self.path.iterdir()) if f.is_file()}
+        return self._index
+
+    @property
+    def names(self):
+        return list(self.index)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def get(self, name):
+        image = self._fitted.get(name)
+        if image is None:
+            path = self.index.get(name)
+            if path is None:
+                return None
+
+            with Image.open(path) as bg_img:
+                image = ImageOps.fit(bg_img, self.size, centering=(0.0, 0.0)).convert("RGBA")
+            self._fitted[name] = image
+
+        return image
+
+    def preload(self):
+        for name in self.index:
+            self.get(name)
+
+
+backgrounds = BackgroundStore("backgrounds")
+
+
+def to_png(image):
+    buffer = BytesIO()
+    image.save(buffer, "png")
+    return buffer.getvalue()
+
+
+def open_image(data, size):
+    """Decodes an asset passed as bytes (or a file object) and fits it to `size`; Images are used as they are."""
+    if isinstance(data, Image.Image):
+        return data
+    if isinstance(data, bytes):
+        data = BytesIO(data)
+    with Image.open(data) as image:
+        return image.resize(size) if image.size != size else image.copy()
+
+
+# Assets are cached and sent to the render workers as small PNGs rather than decoded Images.
+def fit_avatar(data: bytes):
+    with Image.open(BytesIO(data)) as avatar:
+        return to_png(avatar.convert("RGBA").resize((256, 256)))
+
+
+def fit_cover(data: bytes):
+    with Image.open(BytesIO(data)) as cover:
+        return to_png(cover.resize((160, 160)))
+
+
 class Profile:
     def __init__(self):
-        self.font = ImageFont.truetype("arialbd.ttf", 56)
-        self.medium_font = ImageFont.truetype("arialbd.ttf", 44)
-        self.small_font = ImageFont.truetype("arialbd.ttf", 32)
+        self.font = font(BOLD, 56)
+        self.medium_font = font(BOLD, 44)
+        self.small_font = font(BOLD, 32)
+        self.circle = Image.open("images/circle.png")
+        self.circle.load()
 
     def round_corner(self, radius, fill):
         corner = Image.new("RGBA", (radius, radius), (0, 0, 0, 0))
@@ -52,20 +158,13 @@ class Profile:
 
         return rectangle
 
-    def draw(self, user, lvl, xp, profile_bytes: BytesIO, color, bg):
-        profile_bytes = Image.open(profile_bytes)
+    def draw(self, user, lvl, xp, profile_bytes, color, bg):
         w, h = (256, 256)
-        profile_bytes = profile_bytes.resize((w, h))
-
-        if bg != "default":
-            bg_img = False
-            for img in Path("backgrounds/").iterdir():
-                if img.name[:-4] == bg:
-                    bg_img = Image.open(f"backgrounds/{img.name}")
-            if bg_img:
-                im = ImageOps.fit(bg_img, (800, 296), centering=(0.0, 0.0))
-            else:
-                im = Image.new("RGBA", (800, 296), (44, 44, 44, 255))
+        profile_bytes = open_image(profile_bytes, (w, h))
+
+        bg_img = backgrounds.get(bg) if bg != "default" else None
+        if bg_img is not None:
+            im = bg_img.copy()
         else:
             im = Image.new("RGBA", (800, 296), (44, 44, 44, 255))
 
@@ -95,8 +194,7 @@ class Profile:
         im_draw.ellipse((28, 0, w + 40 + 28, h + 40), fill=color)
 
         # Avatar
-        circle = Image.open("images/circle.png")
-        im.paste(profile_bytes, (48, 20), circle)
+        im.paste(profile_bytes, (48, 20), self.circle)
 
         buffer = BytesIO()
         im.save(buffer, "png")
@@ -107,13 +205,13 @@ class Profile:
 
 class SpotifyImage:
     def __init__(self):
-        self.font = ImageFont.truetype("arial-unicode-ms.ttf", 16)
-        self.session = aiohttp.ClientSession()
+        self.font = font(UNICODE, 16)
+        self.spotify_logo = Image.open("images/spotify-512.png").resize((48, 48))
 
-    def draw(self, name, artists, color, album_bytes: BytesIO, track_duration=None, time_end=None):
-        album_bytes = Image.open(album_bytes)
+    def draw(self, name, artists, color, album_bytes, track_duration=None, time_end=None):
         size = (160, 160)
-        album_bytes = album_bytes.resize(size)
+        if album_bytes is not None:
+            album_bytes = open_image(album_bytes, size)
 
         w, h = (500, 170)
         im = Image.new("RGBA", (w, h), color)
@@ -121,20 +219,12 @@ class SpotifyImage:
         im_draw = ImageDraw.Draw(im)
         off_x, off_y, w, h = (5, 5, 495, 165)
 
-        font_size = 1
         max_size = 20
         img_fraction = 0.75
 
-        medium_font = ImageFont.truetype("arial-unicode-ms.ttf", font_size)
-        while medium_font.getsize(name)[0] < img_fraction * im.size[0]:
-            font_size += 1
-            medium_font = ImageFont.truetype("arial-unicode-ms.ttf", font_size)
-
-        if font_size >= max_size:
-            font_size = max_size
-
-        font_size -= 1
-        medium_font = ImageFont.truetype("arial-unicode-ms.ttf", font_size)
+        # The title is one size below whichever comes first: the cap or the first size that overflows.
+        font_size = fit_font_size(UNICODE, name, img_fraction * im.size[0], max_size - 1)
+        medium_font = font(UNICODE, font_size)
 
         im_draw.rectangle((off_x, off_y, w, h), fill=(5, 5, 25))
         im_draw.text((175, 15), name, font=medium_font, fill=(255, 255, 255, 255))
@@ -155,11 +245,10 @@ class SpotifyImage:
         else:
             im_draw.text((175, 130), seconds_to_hms(track_duration), font=self.font, fill=(255, 255, 255, 255))
 
-        im.paste(album_bytes, (5, 5))
+        if album_bytes is not None:
+            im.paste(album_bytes, (5, 5))
 
-        spotify_logo = Image.open("images/spotify-512.png")
-        spotify_logo = spotify_logo.resize((48, 48))
-        im.paste(spotify_logo, (437, 15), spotify_logo)
+        im.paste(self.spotify_logo, (437, 15), self.spotify_logo)
 
         buffer = BytesIO()
         im.save(buffer, "png")
@@ -167,8 +256,25 @@ class SpotifyImage:
 
         return buffer
 
-    async def fetch_cover(self, cover_url):
-        async with self.session as s:
-            async with s.get(cover_url) as r:
-                if r.status == 200:
-                    return await r.read()
+
+# One set of drawers (and so one copy of the fonts and static images) per render worker.
+_profile = None
+_spotify = None
+
+
+def init_worker():
+    global _profile, _spotify
+    _profile = Profile()
+    _spotify = SpotifyImage()
+
+
+def render_profile(user, lvl, xp, avatar: bytes, color, bg):
+    if _profile is None:
+        init_worker()
+    return _profile.draw(user, lvl, xp, avatar, color, bg).getvalue()
+
+
+def render_spotify(name, artists, color, cover: bytes, track_duration=None, time_end=None):
+    if _spotify is None:
+        init_worker()
+    return _spotify.draw(name, artists, color, cover, track_duration, time_end).getvalue()
@@ -1,17 +1,29 @@
 import json
 import logging
 import os
+import queue
+import threading
+import time
 from socket import gethostname
 
 import requests
 
+_STOP = object()
+
 
 class DiscordHandler(logging.Handler):
     """
     A custom handler class which sends logging records, to a webhook.
+
+    Records are queued and posted by a background thread, up to 10 embeds per request, so logging never waits on
+    the network. When the queue is full new records are dropped and reported in a summary embed.
     """
 
-    def __init__(self, webhook_url):
+    max_embeds = 10
+    max_chars = 6000
+    max_description = 2000
+
+    def __init__(self, webhook_url, queue_size=500, timeout=10):
         logging.Handler.__init__(self)
 
         if not os.path.isdir("minesoc/logs"):
@@ -23,6 +35,7 @@ class DiscordHandler(logging.Handler):
         self._webhook_url = webhook_url
         self._agent = gethostname()
         self._header = self._create_header()
+        self._timeout = timeout
 
         self._color_table = {
             "ERROR": 0xe74c3c,
@@ -38,34 +51,124 @@ class DiscordHandler(logging.Handler):
             "DEBUG": "🤔",
         }
 
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._dropped = 0
+        self._dropped_lock = threading.Lock()
+        self._pending = None
+        self._reset_at = 0.0
+
+        self._session = requests.Session()
+        self._worker = threading.Thread(target=self._run, name="discord-webhook", daemon=True)
+        self._worker.start()
+
     def _create_header(self):
         return {
             'User-Agent': self._agent,
             "Content-Type": "application/json"
         }
 
-    def _post_webhook(self, message, record):
-        embed = {
-            "embeds": [
-                {
-                    "title": f"{self._emoji_table[record.levelname]} {record.levelname.title()}",
-                    "description": message,
-                    "color": self._color_table[record.levelname]
-                }
-            ]
+    def _create_embed(self, message, record):
+        if len(message) > self.max_description:
+            message = message[:self.max_description - 7] + "…\n```"
+
+        return {
+            "title": f"{self._emoji_table.get(record.levelname, '')} {record.levelname.title()}",
+            "description": message,
+            "color": self._color_table.get(record.levelname, 0x95a5a6)
         }
 
-        try:
-            requests.post(self._webhook_url, headers=self._header, data=json.dumps(embed))
-        except Exception as ex:
-            print(ex)
+    def _dropped_embed(self, count):
+        return {
+            "title": f"{self._emoji_table['WARNING']} Dropped",
+            "description": f"{count} log record{'s' if count != 1 else ''} dropped because the webhook queue was full.",
+            "color": self._color_table["WARNING"]
+        }
 
-    def handle(self, record):
+    @staticmethod
+    def _size(embed):
+        return len(embed["title"]) + len(embed["description"])
+
+    def _next_batch(self):
+        """Block for one embed, then take whatever else is queued that fits into the same request."""
+        batch = [self._pending if self._pending is not None else self._queue.get()]
+        self._pending = None
+        if batch[0] is _STOP:
+            return None
+
+        with self._dropped_lock:
+            dropped, self._dropped = self._dropped, 0
+        if dropped:
+            batch.insert(0, self._dropped_embed(dropped))
+
+        size = sum(self._size(e) for e in batch)
+        while len(batch) < self.max_embeds:
+            try:
+                embed = self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if embed is _STOP or size + self._size(embed) > self.max_chars:
+                self._pending = embed
+                break
+
+            batch.append(embed)
+            size += self._size(embed)
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self._post_webhook(batch)
+
+    def _post_webhook(self, embeds, attempts=3):
+        for _ in range(attempts):
+            delay = self._reset_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            try:
+                r = self._session.post(self._webhook_url, headers=self._header, data=json.dumps({"embeds": embeds}),
+                                       timeout=self._timeout)
+
+                reset_after = r.headers.get("X-RateLimit-Reset-After")
+                if r.status_code == 429:
+                    retry_after = reset_after or r.headers.get("Retry-After") or 1
+                    self._reset_at = time.monotonic() + float(retry_after)
+                    continue
+
+                if r.headers.get("X-RateLimit-Remaining") == "0" and reset_after:
+                    self._reset_at = time.monotonic() + float(reset_after)
+                r.raise_for_status()
+            except Exception:
+                # There is no single record to blame for a batch, so report it through logging's own fallback.
+                self.handleError(logging.makeLogRecord({"msg": f"Could not post {len(embeds)} log embeds."}))
+            return
+
+    def emit(self, record):
         try:
-            message = self.format(record)
-            self._post_webhook(message=f"```\n{message}\n```", record=record)
+            embed = self._create_embed(f"```\n{self.format(record)}\n```", record)
         except Exception:
             self.handleError(record)
+            return
+
+        try:
+            self._queue.put_nowait(embed)
+        except queue.Full:
+            with self._dropped_lock:
+                self._dropped += 1
+
+    def close(self, timeout=5):
+        """Send whatever is still queued, waiting at most `timeout` seconds."""
+        if self._worker.is_alive():
+            try:
+                self._queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                pass
+            self._worker.join(timeout)
+        logging.Handler.close(self)
 
 
 class CustomLogger(logging.Logger):
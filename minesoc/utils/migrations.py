@@ -0,0 +1,35 @@
+# Arbitrary key so two processes starting at once don't both apply the same migration.
+LOCK_KEY = 0x6d696e65736f63
+
+
+class Migrator:
+    """
+    Applies the numbered .sql files in minesoc/migrations in order, recording each one in schema_version.
+    """
+
+    def __init__(self, bot, directory="migrations"):
+        self.bot = bot
+        self.directory = directory
+
+    @property
+    def migrations(self):
+        files = (self.bot.path / "minesoc" / self.directory).iterdir()
+        return sorted((int(f.name.split("_", 1)[0]), f.name) for f in files if f.suffix == ".sql")
+
+    async def run(self):
+        applied = []
+        async with self.bot.db.acquire() as conn:
+            await conn.execute("CREATE TABLE IF NOT EXISTS schema_version(version INT PRIMARY KEY, "
+                               "name TEXT NOT NULL, applied_at TIMESTAMP NOT NULL DEFAULT now())")
+
+            for version, name in self.migrations:
+                async with conn.transaction():
+                    await conn.execute("SELECT pg_advisory_xact_lock($1)", LOCK_KEY)
+                    if await conn.fetchval("SELECT EXISTS(SELECT 1 FROM schema_version WHERE version=$1)", version):
+                        continue
+
+                    await conn.execute(self.bot.sqlschema.read(f"{self.directory}/{name}"))
+                    await conn.execute("INSERT INTO schema_version (version, name) VALUES ($1, $2)", version, name)
+                    applied.append(name)
+
+        return applied
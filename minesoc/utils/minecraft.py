@@ -0,0 +1,477 @@
+import asyncio
+import base64
+import ipaddress
+import json
+import random
+import re
+import socket
+import struct
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from minesoc.utils import cache
+
+DEFAULT_PORT = 25565
+MAX_PACKET = 2 * 1024 * 1024  # A status JSON with a 64x64 favicon is a few KiB; anything near this is hostile.
+FORMATTING_RX = re.compile("§[0-9a-fk-or]", re.IGNORECASE)
+
+Status = namedtuple("Status", "host port version protocol online max players motd favicon latency")
+Query = namedtuple("Query", "software plugins map online max players")
+Poll = namedtuple("Poll", "status error checked_at")
+Target = namedtuple("Target", "host port ip")
+
+
+class MinecraftError(Exception):
+    def __init__(self, address, stage, message):
+        super().__init__(f"{address}: {message} ({stage})")
+        self.address = address
+        self.stage = stage
+        self.message = message
+
+
+# Encoding
+
+def pack_varint(value):
+    value &= 0xFFFFFFFF
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        out.append(byte | (0x80 if value else 0))
+        if not value:
+            return bytes(out)
+
+
+def unpack_varint(data, offset=0):
+    """Returns the value and the offset just past it."""
+    value = 0
+    for shift in range(0, 35, 7):
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value - (1 << 32) if value & (1 << 31) else value, offset
+    raise ValueError("VarInt is too long")
+
+
+async def read_varint(reader):
+    value = 0
+    for shift in range(0, 35, 7):
+        byte = (await reader.readexactly(1))[0]
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value
+    raise ValueError("VarInt is too long")
+
+
+def packet(packet_id, payload=b""):
+    body = pack_varint(packet_id) + payload
+    return pack_varint(len(body)) + body
+
+
+def pack_string(value):
+    encoded = value.encode("utf-8")
+    return pack_varint(len(encoded)) + encoded
+
+
+def flatten(component):
+    """Plain text of a chat component, which may be a string, a list or a dict with `extra` children."""
+    if isinstance(component, str):
+        return component
+    if isinstance(component, list):
+        return "".join(flatten(part) for part in component)
+    if isinstance(component, dict):
+        return component.get("text", "") + "".join(flatten(part) for part in component.get("extra", ()))
+    return ""
+
+
+def parse_address(address):
+    """Splits `host[:port]`. The port is None when not given, which is when an SRV record may apply."""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit() and "]" not in port:
+        return host.strip("[]"), int(port)
+    return address.strip("[]"), None
+
+
+def is_ip(host):
+    try:
+        ipaddress.ip_address(host.split("%", 1)[0])  # resolv.conf may scope link-local resolvers: fe80::1%eth0
+    except ValueError:
+        return False
+    return True
+
+
+def is_public(ip):
+    """False for loopback, private, link-local, unspecified and other addresses that aren't on the internet."""
+    ip = ipaddress.ip_address(ip.split("%", 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return not (ip.is_loopback or ip.is_private or ip.is_link_local or ip.is_unspecified or ip.is_reserved
+                or ip.is_multicast)
+
+
+def parse_nameserver(nameserver):
+    """Splits a nameserver given as a bare IP, `ipv4:port` or `[ipv6]:port`. The port defaults to 53."""
+    if nameserver.startswith("["):
+        host, _, rest = nameserver[1:].partition("]")
+        return host, int(rest[1:]) if rest.startswith(":") else 53
+    if is_ip(nameserver):
+        return nameserver, 53
+
+    host, _, port = nameserver.rpartition(":")
+    return host, int(port)
+
+
+# UDP
+
+class _Datagrams(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.packets = asyncio.Queue()
+
+    def datagram_received(self, data, addr):
+        self.packets.put_nowait(data)
+
+    def error_received(self, exc):
+        self.packets.put_nowait(exc)
+
+    async def recv(self, timeout):
+        data = await asyncio.wait_for(self.packets.get(), timeout)
+        if isinstance(data, Exception):
+            raise data
+        return data
+
+
+async def open_datagram(host, port):
+    loop = asyncio.get_event_loop()
+    transport, protocol = await loop.create_datagram_endpoint(_Datagrams, remote_addr=(host, port))
+    return transport, protocol
+
+
+# DNS
+
+def system_nameserver(path="/etc/resolv.conf"):
+    try:
+        with open(path) as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0] == "nameserver":
+                    return parts[1]
+    except OSError:
+        pass
+    return "1.1.1.1"
+
+
+def _read_name(data, offset):
+    labels = []
+    end = None
+    for _ in range(128):  # Bounds pointer loops in a malformed reply.
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = offset + 2
+            offset = ((length & 0x3F) << 8) | data[offset + 1]
+            continue
+        offset += 1
+        if not length:
+            return ".".join(labels), end if end is not None else offset
+        labels.append(data[offset:offset + length].decode("ascii", "replace"))
+        offset += length
+    raise ValueError("DNS name is too long")
+
+
+def srv_request(name, query_id):
+    header = struct.pack(">HHHHHH", query_id, 0x0100, 1, 0, 0, 0)
+    question = b"".join(bytes([len(label)]) + label for label in name.encode("idna").split(b".") if label)
+    return header + question + b"\x00" + struct.pack(">HH", 33, 1)
+
+
+def parse_srv(data, query_id):
+    """Returns the (target, port) of the preferred SRV record in a DNS reply, or None if there is none."""
+    reply_id, flags, questions, answers = struct.unpack_from(">HHHH", data)
+    if reply_id != query_id or flags & 0x000F:
+        return None
+
+    offset = 12
+    for _ in range(questions):
+        _, offset = _read_name(data, offset)
+        offset += 4
+
+    records = []
+    for _ in range(answers):
+        _, offset = _read_name(data, offset)
+        rtype, _, _, length = struct.unpack_from(">HHIH", data, offset)
+        offset += 10
+        if rtype == 33:
+            priority, weight, port = struct.unpack_from(">HHH", data, offset)
+            target, _ = _read_name(data, offset + 6)
+            records.append((priority, -weight, target, port))
+        offset += length
+
+    if not records:
+        return None
+    _, _, target, port = min(records)
+    return target.rstrip("."), port
+
+
+async def resolve_srv(host, nameserver, timeout):
+    """Looks up the _minecraft._tcp SRV record of `host` at `nameserver` (see `parse_nameserver`)."""
+    query_id = random.getrandbits(16)
+    transport, protocol = await open_datagram(*parse_nameserver(nameserver))
+    try:
+        transport.sendto(srv_request(f"_minecraft._tcp.{host}", query_id))
+        return parse_srv(await protocol.recv(timeout), query_id)
+    finally:
+        transport.close()
+
+
+def parse_full_stat(data):
+    # 5 byte header, 11 bytes of padding, key/value pairs up to an empty key, 10 bytes of padding, player names.
+    info, _, names = data[16:].partition(b"\x00\x00\x01player_\x00\x00")
+    fields = info.decode("utf-8", "replace").split("\x00")
+    info = dict(zip(fields[::2], fields[1::2]))
+
+    software, _, plugins = info.get("plugins", "").partition(": ")
+    return Query(software=software or info.get("version"),
+                 plugins=[plugin.strip() for plugin in plugins.split(";") if plugin.strip()],
+                 map=info.get("map"), online=int(info.get("numplayers", 0)), max=int(info.get("maxplayers", 0)),
+                 players=[name for name in names.decode("utf-8", "replace").split("\x00") if name])
+
+
+# Client
+
+class MinecraftClient:
+    """
+    Talks to Minecraft servers directly: Server List Ping over TCP and the GameSpy4 query protocol over UDP.
+
+    Each stage (SRV lookup, connect, status read, query) has its own timeout, and results are cached per address for
+    `ttl` seconds. Addresses that resolve to loopback, private or link-local ranges are refused unless
+    `allow_private` is set, so users can't probe the bot host's own network.
+    """
+
+    def __init__(self, nameserver=None, dns_timeout=2.0, connect_timeout=3.0, read_timeout=5.0, query_timeout=2.0,
+                 ttl=30, maxsize=1024, allow_private=False):
+        self.nameserver = nameserver or system_nameserver()
+        self.allow_private = allow_private
+        self.dns_timeout = dns_timeout
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.query_timeout = query_timeout
+        self.cache = cache.TTLCache(maxsize=maxsize, ttl=ttl)
+        self._inflight = {}
+
+    async def resolve(self, address):
+        """
+        Returns the Target to connect to, following the _minecraft._tcp SRV record if there is one.
+
+        The IP is resolved here and used for every connection, so the address that was checked is the one contacted.
+        """
+        host, port = parse_address(address)
+        if port is None and not is_ip(host) and host != "localhost":
+            try:
+                host, port = await resolve_srv(host, self.nameserver, self.dns_timeout) or (host, None)
+            except (asyncio.TimeoutError, OSError, ValueError, IndexError, struct.error):
+                pass  # A missing or broken SRV record just means the plain hostname.
+        port = port or DEFAULT_PORT
+
+        loop = asyncio.get_event_loop()
+        try:
+            infos = await asyncio.wait_for(loop.getaddrinfo(host, port, type=socket.SOCK_STREAM), self.dns_timeout)
+        except (asyncio.TimeoutError, OSError) as e:
+            raise MinecraftError(address, "resolve", "does not resolve") from e
+
+        ips = [info[4][0] for info in infos]
+        if not ips:
+            raise MinecraftError(address, "resolve", "does not resolve")
+        if not self.allow_private and not all(is_public(ip) for ip in ips):
+            raise MinecraftError(address, "resolve", "is not a public address")
+        return Target(host, port, ips[0])
+
+    async def ping(self, address, target=None):
+        """
+        Server List Ping. Raises MinecraftError if the server can't be reached or answers garbage.
+
+        `target` is the Target from `resolve`, for callers that already looked it up.
+        """
+        host, port, ip = target or await self.resolve(address)
+
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), self.connect_timeout)
+        except (asyncio.TimeoutError, OSError) as e:
+            raise MinecraftError(address, "connect", "could not connect") from e
+
+        try:
+            handshake = pack_varint(-1) + pack_string(host) + struct.pack(">H", port) + pack_varint(1)
+            writer.write(packet(0x00, handshake) + packet(0x00))
+            response = await asyncio.wait_for(self._read_status(reader, address), self.read_timeout)
+
+            start = time.perf_counter()
+            writer.write(packet(0x01, struct.pack(">q", int(time.time() * 1000))))
+            try:
+                await asyncio.wait_for(self._read_packet(reader, address), self.read_timeout)
+                latency = (time.perf_counter() - start) * 1000
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, OSError):
+                latency = None  # Some proxies close the connection instead of answering the ping.
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, OSError, ValueError) as e:
+            raise MinecraftError(address, "status", "did not answer the status request") from e
+        finally:
+            writer.close()
+
+        players = response.get("players") or {}
+        version = response.get("version") or {}
+        favicon = response.get("favicon")
+        if favicon and favicon.startswith("data:image/png;base64,"):
+            favicon = base64.b64decode(favicon.split(",", 1)[1])
+        else:
+            favicon = None
+
+        return Status(host=host, port=port, version=version.get("name"), protocol=version.get("protocol"),
+                      online=players.get("online", 0), max=players.get("max", 0),
+                      players=[player.get("name") for player in players.get("sample") or ()],
+                      motd=FORMATTING_RX.sub("", flatten(response.get("description", ""))).strip(),
+                      favicon=favicon, latency=latency)
+
+    async def _read_packet(self, reader, address):
+        length = await read_varint(reader)
+        if length > MAX_PACKET:
+            raise MinecraftError(address, "status", f"sent a {length} byte packet")
+        return await reader.readexactly(length)
+
+    async def _read_status(self, reader, address):
+        data = await self._read_packet(reader, address)
+        packet_id, offset = unpack_varint(data)
+        if packet_id != 0x00:
+            raise ValueError(f"unexpected packet {packet_id}")
+        length, offset = unpack_varint(data, offset)
+        return json.loads(data[offset:offset + length].decode("utf-8"))
+
+    async def query(self, address, target=None):
+        """Full stat over the query protocol. Only answers if the server has `enable-query` set."""
+        # Assumes query.port is the game port, as it is by default.
+        host, port, ip = target or await self.resolve(address)
+        session = random.getrandbits(32) & 0x0F0F0F0F
+
+        try:
+            transport, protocol = await open_datagram(ip, port)
+        except OSError as e:
+            raise MinecraftError(address, "query", "could not resolve") from e
+
+        try:
+            transport.sendto(b"\xFE\xFD\x09" + struct.pack(">i", session))
+            data = await protocol.recv(self.query_timeout)
+            token = int(data[5:].split(b"\x00", 1)[0])
+
+            transport.sendto(b"\xFE\xFD\x00" + struct.pack(">ii", session, token) + b"\x00\x00\x00\x00")
+            return parse_full_stat(await protocol.recv(self.query_timeout))
+        except (asyncio.TimeoutError, OSError, ValueError) as e:
+            raise MinecraftError(address, "query", "did not answer the query") from e
+        finally:
+            transport.close()
+
+    async def _cached(self, kind, address, fetch, target=None):
+        key = (kind, address.lower())
+        result = self.cache.get(key)
+        if result is not None:
+            return result
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(fetch(address, target))
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        result = await asyncio.shield(task)
+        self.cache.set(key, result)
+        return result
+
+    async def status(self, address, target=None):
+        return await self._cached("status", address, self.ping, target)
+
+    async def status_many(self, addresses, concurrency=8):
+        """Pings many servers with at most `concurrency` in flight. Returns Status or MinecraftError, in order."""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(address):
+            async with semaphore:
+                try:
+                    return await self.status(address)
+                except MinecraftError as e:
+                    return e
+
+        return await asyncio.gather(*[one(address) for address in addresses])
+
+    async def full_stat(self, address, target=None):
+        return await self._cached("query", address, self.query, target)
+
+
+def normalize_address(address):
+    return address.strip().lower()
+
+
+class Watchlist:
+    """
+    Addresses each guild watches, polled by one background loop.
+
+    An address watched by several guilds is still pinged once per interval. Commands read the last `Poll` of an
+    address from `results` instead of pinging it themselves.
+    """
+
+    def __init__(self, bot, client: MinecraftClient, interval=60, concurrency=16):
+        self.bot = bot
+        self.client = client
+        self.interval = interval
+        self.concurrency = concurrency
+        self.guilds = {}
+        self.results = {}
+
+    @property
+    def addresses(self):
+        return {address for addresses in self.guilds.values() for address in addresses}
+
+    def watched(self, guild):
+        return sorted(self.guilds.get(guild, ()))
+
+    async def load(self):
+        guilds = {}
+        for row in await self.bot.db.fetch("SELECT guild_id, address FROM minecraft_watch"):
+            guilds.setdefault(row["guild_id"], set()).add(row["address"])
+        self.guilds = guilds
+
+    async def add(self, guild, address, user):
+        """Raises MinecraftError if the address doesn't resolve to a server the bot may contact."""
+        address = normalize_address(address)
+        await self.client.resolve(address)
+        await self.bot.db.execute("INSERT INTO minecraft_watch (guild_id, address, added_by) VALUES ($1, $2, $3) "
+                                  "ON CONFLICT DO NOTHING", guild, address, user)
+        self.guilds.setdefault(guild, set()).add(address)
+        if address not in self.results:
+            await self.poll([address])
+        return address
+
+    async def remove(self, guild, address):
+        address = normalize_address(address)
+        removed = await self.bot.db.fetchval("DELETE FROM minecraft_watch WHERE guild_id=$1 AND address=$2 "
+                                             "RETURNING address", guild, address)
+        addresses = self.guilds.get(guild, set())
+        addresses.discard(address)
+        if not addresses:
+            self.guilds.pop(guild, None)
+        if address not in self.addresses:
+            self.results.pop(address, None)
+        return removed is not None
+
+    async def poll(self, addresses):
+        statuses = await self.client.status_many(addresses, concurrency=self.concurrency)
+        now = datetime.utcnow()
+        for address, status in zip(addresses, statuses):
+            if isinstance(status, MinecraftError):
+                self.results[address] = Poll(None, status, now)
+            else:
+                self.results[address] = Poll(status, None, now)
+
+    async def run(self):
+        while not self.bot.is_closed():
+            try:
+                await self.poll(sorted(self.addresses))
+            except Exception as e:
+                self.bot.logger.error("Failed to poll watched Minecraft servers.", exc_info=e)
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,107 @@
+import asyncio
+
+FRAMES_PER_MINUTE = 3000  # 20ms Opus frames per playing player.
+
+
+def penalty(node):
+    """Lavalink's own load-balancing penalty, computed from a node's last stats update."""
+    stats = node.stats
+    if stats is None:
+        return 0.0
+
+    cpu = 1.05 ** (100 * stats.system_load) * 10 - 10
+    frames = 0.0
+    if stats.frames_deficit != -1:
+        frames += 1.03 ** (500 * (stats.frames_deficit / FRAMES_PER_MINUTE)) * 600 - 600
+        frames += (1.03 ** (500 * (stats.frames_nulled / FRAMES_PER_MINUTE)) * 300 - 300) * 2
+    return stats.playing_players + cpu + frames
+
+
+class NodePool:
+    """
+    Places players on the least loaded Lavalink node and moves them off nodes that become unhealthy.
+
+    Nodes and players are only used through the attributes lavalink.py exposes (`available`, `region`, `stats`,
+    `player.node`, `player.change_node`), so stand-in nodes work just as well.
+    """
+
+    def __init__(self, bot, client, interval=30, cpu_limit=0.9, deficit_limit=0.1, max_moves=5):
+        self.bot = bot
+        self.client = client
+        self.interval = interval
+        self.cpu_limit = cpu_limit
+        self.deficit_limit = deficit_limit
+        self.max_moves = max_moves
+        self.moved = 0
+
+    @property
+    def nodes(self):
+        return self.client.node_manager.nodes
+
+    @property
+    def players(self):
+        return list(self.client.players.players.values())
+
+    def healthy(self, node):
+        if not node.available:
+            return False
+
+        stats = node.stats
+        if stats is None:
+            return True
+        if stats.system_load >= self.cpu_limit:
+            return False
+        if stats.frames_deficit > 0 and stats.playing_players:
+            return stats.frames_deficit / (stats.playing_players * FRAMES_PER_MINUTE) < self.deficit_limit
+        return True
+
+    def score(self, node):
+        # Stats only arrive once a minute, so count the players placed on the node since then as well.
+        placed = sum(1 for player in self.players if player.node is node)
+        reported = node.stats.players if node.stats is not None else 0
+        return penalty(node) + max(placed - reported, 0)
+
+    def best(self, region=None, exclude=None):
+        """The healthy node with the lowest score, preferring nodes in `region` (a guild's voice region)."""
+        candidates = [node for node in self.nodes if node is not exclude and self.healthy(node)]
+        if not candidates:
+            return None
+
+        if region:
+            local = [node for node in candidates if node.region and region.startswith(node.region)]
+            candidates = local or candidates
+        return min(candidates, key=self.score)
+
+    async def rebalance(self):
+        """Moves players off unhealthy nodes, a few per node at a time. Queues stay with the player."""
+        moved = 0
+        for node in self.nodes:
+            if self.healthy(node):
+                continue
+
+            players = [player for player in self.players if player.node is node]
+            if node.available:
+                players = players[:self.max_moves]  # Still serving audio; don't swamp the others at once.
+
+            for player in players:
+                target = self.best(player.fetch("region"), exclude=node)
+                if target is None:
+                    break
+                try:
+                    await player.change_node(target)
+                except Exception as e:
+                    self.bot.logger.warning(f"Could not move player {player.guild_id} off node {node.name}.",
+                                            exc_info=e)
+                    continue
+                moved += 1
+
+        self.moved += moved
+        return moved
+
+    async def run(self):
+        while not self.bot.is_closed():
+            await asyncio.sleep(self.interval)
+            try:
+                await self.rebalance()
+            except Exception as e:
+                self.bot.logger.error("Failed to rebalance Lavalink players.", exc_info=e)
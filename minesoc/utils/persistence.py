@@ -0,0 +1,37 @@
+from collections import namedtuple
+
+Settings = namedtuple("Settings", "lvl_msg lvls")
+
+DEFAULT = Settings(lvl_msg=True, lvls=True)
+
+
+class PersistenceSettings:
+    """
+    In-memory copy of the persistence table, keyed by guild id.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.guilds = {}
+
+    def get(self, guild: int):
+        return self.guilds.get(guild, DEFAULT)
+
+    async def provision(self, guilds):
+        # The CTE's snapshot doesn't include its own inserts, so each guild comes back from exactly one side.
+        rows = await self.bot.db.fetch(
+            "WITH ins AS (INSERT INTO persistence (guild) SELECT unnest($1::bigint[]) ON CONFLICT (guild) DO NOTHING "
+            "RETURNING guild, lvl_msg, lvls) "
+            "SELECT guild, lvl_msg, lvls FROM ins "
+            "UNION ALL SELECT guild, lvl_msg, lvls FROM persistence WHERE guild = ANY($1::bigint[])", list(guilds))
+
+        for row in rows:
+            self.guilds[row["guild"]] = Settings(row["lvl_msg"], row["lvls"])
+
+    async def set(self, guild: int, **fields):
+        settings = self.get(guild)._replace(**fields)
+        await self.bot.db.execute("INSERT INTO persistence (guild, lvl_msg, lvls) VALUES ($1, $2, $3) "
+                                  "ON CONFLICT (guild) DO UPDATE SET lvl_msg=EXCLUDED.lvl_msg, lvls=EXCLUDED.lvls",
+                                  guild, settings.lvl_msg, settings.lvls)
+        self.guilds[guild] = settings
+        return settings
@@ -0,0 +1,178 @@
+import asyncio
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from itertools import islice
+
+
+class SortedList:
+    """
+    A list kept in sorted order, split into buckets of roughly `load` items so inserts and removals only shift one
+    bucket. Lookups bisect the bucket maxima, then the bucket.
+    """
+
+    def __init__(self, values=(), load=512):
+        self._load = load
+        values = sorted(values)
+        self._lists = [values[i:i + load] for i in range(0, len(values), load)]
+        self._maxes = [bucket[-1] for bucket in self._lists]
+        self._len = len(values)
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for bucket in self._lists:
+            yield from bucket
+
+    def add(self, value):
+        if not self._maxes:
+            self._lists.append([value])
+            self._maxes.append(value)
+        else:
+            pos = bisect_left(self._maxes, value)
+            if pos == len(self._maxes):
+                pos -= 1
+                self._lists[pos].append(value)
+                self._maxes[pos] = value
+            else:
+                insort(self._lists[pos], value)
+
+            bucket = self._lists[pos]
+            if len(bucket) > self._load * 2:
+                self._lists.insert(pos + 1, bucket[self._load:])
+                del bucket[self._load:]
+                self._maxes.insert(pos, bucket[-1])
+
+        self._len += 1
+
+    def remove(self, value):
+        pos = bisect_left(self._maxes, value)
+        if pos == len(self._maxes):
+            raise ValueError(f"{value!r} not in list")
+
+        bucket = self._lists[pos]
+        index = bisect_left(bucket, value)
+        if bucket[index] != value:
+            raise ValueError(f"{value!r} not in list")
+
+        del bucket[index]
+        self._len -= 1
+        if not bucket:
+            del self._lists[pos]
+            del self._maxes[pos]
+        elif index == len(bucket):
+            self._maxes[pos] = bucket[-1]
+
+    def _position(self, value, bisect):
+        pos = bisect(self._maxes, value)
+        if pos == len(self._maxes):
+            return self._len
+        return sum(len(bucket) for bucket in self._lists[:pos]) + bisect(self._lists[pos], value)
+
+    def bisect_left(self, value):
+        return self._position(value, bisect_left)
+
+    def bisect_right(self, value):
+        return self._position(value, bisect_right)
+
+    def islice(self, start, stop):
+        for pos, bucket in enumerate(self._lists):
+            if start < len(bucket):
+                break
+            start -= len(bucket)
+            stop -= len(bucket)
+        else:
+            return []
+
+        return list(islice((v for bucket in self._lists[pos:] for v in bucket), start, stop))
+
+
+class GuildRanking:
+    """
+    Members of one guild ordered the same way as the SQL leaderboard: xp, then user_id, both descending.
+    """
+
+    def __init__(self, rows):
+        self.members = {row["user_id"]: (row["xp"], row["lvl"]) for row in rows}
+        self.order = SortedList((-xp, -user) for user, (xp, _) in self.members.items())
+
+    def __len__(self):
+        return len(self.members)
+
+    def update(self, user, xp, lvl):
+        old = self.members.get(user)
+        if old is not None:
+            self.order.remove((-old[0], -user))
+        self.members[user] = (xp, lvl)
+        self.order.add((-xp, -user))
+
+    def _row(self, key):
+        user = -key[1]
+        xp, lvl = self.members[user]
+        return {"user_id": user, "xp": xp, "lvl": lvl}
+
+    def page(self, after=None, limit=10):
+        start = 0 if after is None else self.order.bisect_right((-after[0], -after[1]))
+        return [self._row(key) for key in self.order.islice(start, start + limit)]
+
+    def rank(self, user):
+        if user not in self.members:
+            return None
+
+        xp, lvl = self.members[user]
+        return {"xp": xp, "lvl": lvl, "rank": self.order.bisect_left((-xp, -user)) + 1}
+
+
+class Leaderboards:
+    """
+    Lazily loaded GuildRankings, evicting the least recently used guilds once more than `max_members` members are
+    held across all of them.
+    """
+
+    def __init__(self, bot, enabled=False, max_members=500000):
+        self.bot = bot
+        self.enabled = enabled
+        self.max_members = max_members
+        self.size = 0
+        self.guilds = OrderedDict()
+        self._loading = {}
+
+    async def _load(self, guild):
+        await self.bot.xp.flush(guild)
+        rows = await self.bot.db.fetch("SELECT user_id, xp, lvl FROM levels WHERE guild_id=$1", guild)
+        ranking = GuildRanking(rows)
+
+        # XP awarded while the snapshot loaded is only in the accumulator, which is always at least as new.
+        for (entry_guild, user), entry in list(self.bot.xp.entries.items()):
+            if entry_guild == guild:
+                ranking.update(user, entry.xp, entry.lvl)
+
+        self.guilds[guild] = ranking
+        self.size += len(ranking)
+        self._evict()
+        return ranking
+
+    async def get(self, guild):
+        ranking = self.guilds.get(guild)
+        if ranking is not None:
+            self.guilds.move_to_end(guild)
+            return ranking
+
+        task = self._loading.get(guild)
+        if task is None:
+            task = self._loading[guild] = asyncio.ensure_future(self._load(guild))
+            task.add_done_callback(lambda _: self._loading.pop(guild, None))
+
+        return await asyncio.shield(task)
+
+    def update(self, guild, user, xp, lvl):
+        ranking = self.guilds.get(guild)
+        if ranking is not None:
+            before = len(ranking)
+            ranking.update(user, xp, lvl)
+            self.size += len(ranking) - before
+
+    def _evict(self):
+        while self.size > self.max_members and len(self.guilds) > 1:
+            _, ranking = self.guilds.popitem(last=False)
+            self.size -= len(ranking)
@@ -0,0 +1,59 @@
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+from minesoc.utils import images, errors, cache
+
+
+def card_key(*inputs):
+    """Hash of everything that affects how a card looks."""
+    return hashlib.blake2b(repr(inputs).encode(), digest_size=16).digest()
+
+
+class RenderService:
+    """
+    Runs the image cards in a pool of worker processes so encoding never blocks the event loop.
+
+    With `workers` set to 0 the default thread pool is used instead.
+    """
+
+    def __init__(self, bot, workers=2, max_pending=16, cache_bytes=32 * 1024 * 1024, preload=True):
+        self.bot = bot
+        self.workers = workers
+        self.max_pending = max_pending
+        self.preload = preload
+        self.pending = 0
+        self.cards = cache.SizedLRUCache(maxbytes=cache_bytes)
+        self._executor = None
+
+    def _ensure_executor(self):
+        if self._executor is None and self.workers > 0:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=images.init_worker)
+        return self._executor
+
+    async def start(self):
+        if self.preload:
+            # Fitting the backgrounds before the pool forks lets every worker share the decoded pixels.
+            await self.bot.loop.run_in_executor(None, images.backgrounds.preload)
+        self._ensure_executor()
+
+    async def _submit(self, func, *args):
+        if self.pending >= self.max_pending:
+            raise errors.RenderBusy
+
+        self.pending += 1
+        try:
+            return await self.bot.loop.run_in_executor(self._ensure_executor(), func, *args)
+        finally:
+            self.pending -= 1
+
+    async def profile(self, user, lvl, xp, avatar, color, bg):
+        """Render a rank card, returning the PNG bytes."""
+        return await self._submit(images.render_profile, user, lvl, xp, avatar, color, bg)
+
+    async def spotify(self, name, artists, color, cover, track_duration=None, time_end=None):
+        """Render a Spotify card, returning the PNG bytes."""
+        return await self._submit(images.render_spotify, name, list(artists), color, cover, track_duration, time_end)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
@@ -0,0 +1,97 @@
+import asyncio
+import time
+
+import aiohttp
+
+
+class SpotifyError(Exception):
+    def __init__(self, status, message):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+        self.message = message
+
+
+class SpotifyClient:
+    """
+    A small async client for the Spotify Web API using the client credentials flow.
+
+    The access token is reused until shortly before it expires, and the pages of long albums and playlists are
+    fetched concurrently.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, client_id, client_secret, concurrency=8,
+                 api_url="https://api.spotify.com/v1", token_url="https://accounts.spotify.com/api/token"):
+        self.session = session
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.concurrency = concurrency
+        self.api_url = api_url
+        self.token_url = token_url
+
+        self._token = None
+        self._expires = 0.0
+        self._token_lock = asyncio.Lock()
+
+    async def token(self):
+        if self._token is not None and time.monotonic() < self._expires:
+            return self._token
+
+        async with self._token_lock:
+            if self._token is not None and time.monotonic() < self._expires:
+                return self._token
+
+            auth = aiohttp.BasicAuth(str(self.client_id), str(self.client_secret))
+            async with self.session.post(self.token_url, data={"grant_type": "client_credentials"}, auth=auth) as r:
+                payload = await r.json(content_type=None)
+                if r.status != 200:
+                    raise SpotifyError(r.status, payload.get("error_description", "Authentication failed"))
+
+            self._token = payload["access_token"]
+            # Renew a minute early so a request never goes out with a token that expires in flight.
+            self._expires = time.monotonic() + payload["expires_in"] - 60
+            return self._token
+
+    async def _get(self, path, attempts=3, **params):
+        params = {key: str(value) for key, value in params.items()}
+        for _ in range(attempts):
+            headers = {"Authorization": f"Bearer {await self.token()}"}
+            async with self.session.get(f"{self.api_url}/{path}", params=params, headers=headers) as r:
+                if r.status == 401:
+                    self._token = None
+                    continue
+                if r.status == 429:
+                    await asyncio.sleep(float(r.headers.get("Retry-After", 1)))
+                    continue
+
+                payload = await r.json(content_type=None)
+                if r.status != 200:
+                    raise SpotifyError(r.status, payload.get("error", {}).get("message", "Request failed"))
+                return payload
+
+        raise SpotifyError(r.status, "Gave up after retrying")
+
+    async def _paged(self, path, limit):
+        first = await self._get(path, limit=limit, offset=0)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def page(offset):
+            async with semaphore:
+                return await self._get(path, limit=limit, offset=offset)
+
+        # The first page carries the total, so every other page can be requested at once.
+        rest = await asyncio.gather(*(page(offset) for offset in range(limit, first["total"], limit)))
+
+        items = list(first["items"])
+        for result in rest:
+            items.extend(result["items"])
+        return items
+
+    async def track(self, track_id):
+        return await self._get(f"tracks/{track_id}")
+
+    async def album_tracks(self, album_id):
+        return await self._paged(f"albums/{album_id}/tracks", 50)
+
+    async def playlist_tracks(self, playlist_id):
+        items = await self._paged(f"playlists/{playlist_id}/tracks", 100)
+        return [item["track"] for item in items if item.get("track")]
@@ -0,0 +1,135 @@
+import asyncio
+import time
+
+CD = 120
+
+
+def xp_for_level(lvl):
+    return round((4 * (lvl ** 3) / 5))
+
+
+class Entry:
+    __slots__ = ("xp", "lvl", "cd", "dirty")
+
+    def __init__(self, xp, lvl, cd, dirty=False):
+        self.xp = xp
+        self.lvl = lvl
+        self.cd = cd
+        self.dirty = dirty
+
+
+class XPAccumulator:
+    """
+    Keeps per-(guild_id, user_id) XP in memory and writes it back to the levels table in batches.
+
+    Members with unwritten XP are also indexed by guild in `dirty`, so flushing one guild only touches its own.
+    """
+
+    def __init__(self, bot, interval=30):
+        self.bot = bot
+        self.interval = interval
+        self.entries = {}
+        self.dirty = {}
+        self._loading = {}
+        self._flush_lock = asyncio.Lock()
+
+    async def _load(self, key):
+        guild, user = key
+        row = await self.bot.db.fetchrow("SELECT xp, lvl, cd FROM levels WHERE user_id=$1 AND guild_id=$2",
+                                         user, guild)
+        if row:
+            return Entry(row["xp"], row["lvl"], row["cd"])
+        return None
+
+    async def get(self, guild, user):
+        key = (guild, user)
+        entry = self.entries.get(key)
+        if entry is not None:
+            return entry
+
+        # Concurrent messages from the same member share one lookup.
+        future = self._loading.get(key)
+        if future is None:
+            future = self._loading[key] = self.bot.loop.create_task(self._load(key))
+            try:
+                entry = await future
+            finally:
+                del self._loading[key]
+            if entry is not None:
+                self.entries.setdefault(key, entry)
+        else:
+            await future
+
+        return self.entries.get(key)
+
+    def peek(self, guild, user):
+        return self.entries.get((guild, user))
+
+    def _mark(self, guild, user, entry):
+        entry.dirty = True
+        self.dirty.setdefault(guild, set()).add(user)
+
+    async def award(self, guild, user):
+        """Apply one message worth of XP. Returns the new level if the member levelled up."""
+        now = time.time()
+        entry = await self.get(guild, user)
+
+        if entry is None:
+            entry = self.entries[(guild, user)] = Entry(self.bot.xp_gain(), 1, now)
+            self._mark(guild, user, entry)
+            self.bot.leaderboards.update(guild, user, entry.xp, entry.lvl)
+            return None
+
+        if now - entry.cd <= CD:
+            return None
+
+        entry.xp += self.bot.xp_gain()
+        entry.cd = now
+        self._mark(guild, user, entry)
+
+        levelled = entry.xp >= xp_for_level(entry.lvl)
+        if levelled:
+            entry.lvl += 1
+
+        self.bot.leaderboards.update(guild, user, entry.xp, entry.lvl)
+        return entry.lvl if levelled else None
+
+    async def flush(self, guild=None):
+        """Writes pending XP back. With `guild` given, only that guild's entries are written."""
+        async with self._flush_lock:
+            guilds = list(self.dirty) if guild is None else [guild]
+            dirty = [((g, user), self.entries[(g, user)]) for g in guilds for user in self.dirty.pop(g, ())]
+            if not dirty:
+                return 0
+
+            for _, entry in dirty:
+                entry.dirty = False
+
+            rows = [(user, guild, e.xp, e.lvl, e.cd) for (guild, user), e in dirty]
+
+            try:
+                await self.bot.db.executemany("INSERT INTO levels (user_id, guild_id, xp, lvl, cd) "
+                                              "VALUES ($1, $2, $3, $4, $5) ON CONFLICT (user_id, guild_id) "
+                                              "DO UPDATE SET xp=EXCLUDED.xp, lvl=EXCLUDED.lvl, cd=EXCLUDED.cd", rows)
+            except Exception:
+                for (g, user), entry in dirty:
+                    self._mark(g, user, entry)
+                raise
+
+            if guild is None:
+                self._evict()
+            return len(dirty)
+
+    def _evict(self):
+        # Members past their cooldown gain nothing from staying resident; reload them on their next message.
+        cutoff = time.time() - CD
+        for key in [k for k, e in self.entries.items() if not e.dirty and e.cd < cutoff]:
+            del self.entries[key]
+
+    async def run(self):
+        while not self.bot.is_closed():
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                self.bot.logger.error("Failed to flush XP to the database.", exc_info=e)
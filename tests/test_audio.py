@@ -0,0 +1,151 @@
+import asyncio
+import json
+import random
+import time
+from decimal import Decimal
+from types import SimpleNamespace
+
+from minesoc.utils import audio
+
+
+class FakeDB:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    async def fetch(self, query, *args):
+        self.queries.append(query)
+        return self.rows
+
+    async def execute(self, query, *args):
+        self.queries.append(query)
+
+
+def test_search_cache_loads_decimal_ages():
+    # asyncpg returns extract(epoch ...) as Decimal on PostgreSQL 14+.
+    result = {"loadType": "SEARCH_RESULT", "tracks": [{"track": "abc", "info": {"title": "Song"}}]}
+    rows = [{"query": "ytsearch:song", "result": json.dumps(result), "age": Decimal("120.5")},
+            {"query": "ytsearch:other", "result": json.dumps(result), "age": Decimal("3600")}]
+    bot = SimpleNamespace(db=FakeDB(rows))
+    searches = audio.SearchCache(bot, ttl=86400, persist=True)
+
+    assert asyncio.run(searches.load()) == 2
+    assert searches.cache.get("ytsearch:song") == result
+    assert searches.cache.get("ytsearch:other") == result
+
+    expires, _ = searches.cache._data["ytsearch:song"]
+    assert abs(expires - (time.monotonic() + 86400 - 120.5)) < 5
+
+
+def test_search_cache_prunes_expired_rows():
+    bot = SimpleNamespace(db=FakeDB([]), logger=None)
+    searches = audio.SearchCache(bot, ttl=60, persist=True)
+    result = {"loadType": "SEARCH_RESULT", "tracks": [{"track": "abc", "info": {}}]}
+
+    asyncio.run(searches.load())
+    assert bot.db.queries[0].startswith("DELETE FROM search_cache")
+
+    # Storing right after loading doesn't prune again...
+    asyncio.run(searches._store("ytsearch:song", result))
+    assert sum(query.startswith("DELETE") for query in bot.db.queries) == 1
+
+    # ...but once a full ttl has passed it does.
+    searches._pruned -= 60
+    asyncio.run(searches._store("ytsearch:song", result))
+    assert sum(query.startswith("DELETE") for query in bot.db.queries) == 2
+
+
+def test_search_cache_load_is_noop_without_persist():
+    bot = SimpleNamespace(db=FakeDB([]))
+    searches = audio.SearchCache(bot, persist=False)
+
+    assert asyncio.run(searches.load()) == 0
+    assert bot.db.queries == []
+
+
+class FakeNode:
+    def __init__(self):
+        self.queries = []
+
+    async def get_tracks(self, query):
+        self.queries.append(query)
+        return {"loadType": "SEARCH_RESULT", "tracks": [{"track": f"enc:{query}", "info": {}}]}
+
+
+class FakePlayer:
+    def __init__(self):
+        self.node = FakeNode()
+        self.queue = []
+        self.is_playing = True
+
+    def add(self, requester, track):
+        self.queue.append(track["track"])
+
+
+class FakeTrackMap:
+    def __init__(self, known):
+        self.known = known
+        self.stored = []
+
+    async def lookup(self, node, tracks):
+        return {track.id: self.known[track.id] for track in tracks if track.id in self.known}
+
+    async def store(self, resolved):
+        self.stored.extend(resolved)
+
+
+def spotify_track(id):
+    return {"id": id, "name": f"song {id}", "artists": [{"name": "artist"}]}
+
+
+def test_resolve_job_counts_known_tracks_as_resolved():
+    async def run():
+        player = FakePlayer()
+        known = FakeTrackMap({"a": {"track": "known:a", "info": {}}, "c": {"track": "known:c", "info": {}}})
+        job = audio.ResolveJob(player, [spotify_track(i) for i in "abc"], 1, audio.SearchCache(None), known)
+        await job.start()
+        await asyncio.sleep(0)
+        return player, job, known
+
+    player, job, known = asyncio.run(run())
+    assert player.queue == ["known:a", "enc:ytsearch:song b artist lyrics", "known:c"]
+    assert player.node.queries == ["ytsearch:song b artist lyrics"]
+    assert job.resolved == job.total == 3
+    assert [sid for sid, _ in known.stored] == ["b"]
+
+
+def test_resolve_job_drops_finished_predecessor():
+    async def run():
+        player = FakePlayer()
+        known = FakeTrackMap({})
+        first = audio.ResolveJob(player, [spotify_track("a")], 1, audio.SearchCache(None), known)
+        second = audio.ResolveJob(player, [spotify_track("b")], 1, audio.SearchCache(None), known, previous=first)
+        first.start()
+        await second.start()
+        return player, second
+
+    player, second = asyncio.run(run())
+    assert player.queue == ["enc:ytsearch:song a artist lyrics", "enc:ytsearch:song b artist lyrics"]
+    assert second.previous is None
+    second.cancel()
+
+
+def test_shuffled_lazy_queue_places_new_entries_randomly():
+    random.seed(7)
+    lazy = audio.LazyQueue(FakePlayer(), audio.SearchCache(None), FakeTrackMap({}))
+    lazy.extend([spotify_track(str(i)) for i in range(20)], 1)
+    assert [entry.id for entry in lazy.entries] == [str(i) for i in range(20)]
+
+    lazy.shuffle()
+    lazy.extend([spotify_track(f"new{i}") for i in range(20)], 1)
+    ids = [entry.id for entry in lazy.entries]
+    assert sorted(ids[-20:]) != sorted(f"new{i}" for i in range(20))  # Not just appended after the snapshot.
+
+    lazy.add({"track": "resolved", "info": {}}, 1)
+    assert len(lazy) == 41
+
+    lazy.shuffle(False)
+    lazy.extend([spotify_track("last")], 1)
+    lazy.add({"track": "after", "info": {}}, 1)
+    assert lazy.entries[-2].id == "last"
+    assert lazy.entries[-1].track == {"track": "after", "info": {}}
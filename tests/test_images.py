@@ -0,0 +1,41 @@
+from io import BytesIO
+
+from PIL import Image
+
+from minesoc.utils import images
+
+
+def encoded(size, mode="RGB", fmt="jpeg"):
+    buffer = BytesIO()
+    Image.new(mode, size, (200, 30, 30)).save(buffer, fmt)
+    return buffer.getvalue()
+
+
+def test_fit_avatar_caches_png_bytes():
+    avatar = images.fit_avatar(encoded((1024, 1024)))
+
+    assert isinstance(avatar, bytes)
+    assert len(avatar) < 256 * 256 * 4
+    with Image.open(BytesIO(avatar)) as image:
+        assert image.format == "PNG"
+        assert image.size == (256, 256)
+        assert image.mode == "RGBA"
+
+
+def test_fit_cover_caches_png_bytes():
+    cover = images.fit_cover(encoded((640, 640)))
+
+    with Image.open(BytesIO(cover)) as image:
+        assert image.size == (160, 160)
+
+
+def test_open_image_decodes_cached_bytes():
+    image = images.open_image(images.fit_avatar(encoded((64, 64))), (256, 256))
+    assert image.size == (256, 256)
+    assert image.mode == "RGBA"
+
+    # Raw downloads that skipped the transform are still fitted to the card.
+    assert images.open_image(encoded((500, 300), fmt="png"), (160, 160)).size == (160, 160)
+
+    already = Image.new("RGBA", (256, 256))
+    assert images.open_image(already, (256, 256)) is already
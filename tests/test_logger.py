@@ -0,0 +1,119 @@
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from minesoc.utils.logger import DiscordHandler
+
+
+class FakeWebhook:
+    """A local stand-in for a Discord webhook that records every post."""
+
+    def __init__(self):
+        self.posts = []
+        self.responses = []  # (status, headers) to answer with before falling back to 204.
+        self.release = threading.Event()
+        self.release.set()
+        self.received = threading.Condition()
+
+        webhook = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with webhook.received:
+                    webhook.posts.append((time.monotonic(), body["embeds"]))
+                    webhook.received.notify_all()
+                webhook.release.wait(5)
+
+                status, headers = webhook.responses.pop(0) if webhook.responses else (204, {})
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/webhook"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def wait_for(self, count, timeout=5):
+        with self.received:
+            assert self.received.wait_for(lambda: len(self.posts) >= count, timeout)
+
+    @property
+    def embeds(self):
+        return [embed for _, embeds in self.posts for embed in embeds]
+
+
+@pytest.fixture
+def webhook():
+    server = FakeWebhook()
+    yield server
+    server.release.set()
+    server.server.shutdown()
+
+
+def record(message, level=logging.INFO):
+    return logging.LogRecord("test", level, __file__, 1, message, None, None)
+
+
+def test_batches_up_to_ten_embeds_per_post(webhook):
+    handler = DiscordHandler(webhook.url)
+    webhook.release.clear()
+    handler.emit(record("first"))
+    webhook.wait_for(1)
+
+    # Queued while the first post is in flight, so they go out in full batches.
+    for i in range(25):
+        handler.emit(record(f"record {i}"))
+    webhook.release.set()
+    handler.close()
+
+    sizes = [len(embeds) for _, embeds in webhook.posts]
+    assert sizes == [1, 10, 10, 5]
+    assert [embed["description"] for embed in webhook.embeds[1:]] == [f"```\nrecord {i}\n```" for i in range(25)]
+
+
+def test_waits_for_rate_limit_reset_after_429(webhook):
+    webhook.responses = [(429, {"X-RateLimit-Reset-After": "0.3"})]
+    handler = DiscordHandler(webhook.url)
+    handler.emit(record("limited", logging.WARNING))
+    webhook.wait_for(2)
+    handler.close()
+
+    (first_at, first), (second_at, second) = webhook.posts
+    assert first == second
+    assert second_at - first_at >= 0.3
+
+
+def test_reports_dropped_records_when_queue_overflows(webhook):
+    handler = DiscordHandler(webhook.url, queue_size=5)
+    webhook.release.clear()
+    handler.emit(record("first"))
+    webhook.wait_for(1)
+
+    for i in range(20):
+        handler.emit(record(f"record {i}"))
+    webhook.release.set()
+    handler.close()
+
+    _, batch = webhook.posts[1]
+    assert batch[0]["title"].endswith("Dropped")
+    assert batch[0]["description"].startswith("15 log records dropped")
+    assert [embed["description"] for embed in batch[1:]] == [f"```\nrecord {i}\n```" for i in range(5)]
+
+
+def test_failed_posts_go_to_logging_fallback(webhook, capsys):
+    webhook.responses = [(400, {})]
+    handler = DiscordHandler(webhook.url)
+    handler.emit(record("rejected"))
+    handler.close()
+
+    assert "Could not post 1 log embeds." in capsys.readouterr().err
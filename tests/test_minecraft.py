@@ -0,0 +1,172 @@
+import asyncio
+import base64
+import json
+import socket
+import struct
+
+import pytest
+
+from minesoc.utils import minecraft
+
+
+@pytest.mark.parametrize("nameserver, expected", [
+    ("1.1.1.1", ("1.1.1.1", 53)),
+    ("127.0.0.1:5353", ("127.0.0.1", 5353)),
+    ("::1", ("::1", 53)),
+    ("fe80::1", ("fe80::1", 53)),
+    ("fe80::1%eth0", ("fe80::1%eth0", 53)),
+    ("[::1]", ("::1", 53)),
+    ("[::1]:5353", ("::1", 5353)),
+])
+def test_parse_nameserver(nameserver, expected):
+    assert minecraft.parse_nameserver(nameserver) == expected
+
+
+class FakeDNS(asyncio.DatagramProtocol):
+    """Answers every SRV question with 127.0.0.1:<port>, a name that resolves without a network."""
+
+    def __init__(self, port):
+        self.port = port
+        self.requests = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.requests += 1
+        target = b"\x03127\x010\x010\x011\x00"
+        answer = b"\xc0\x0c" + struct.pack(">HHIH", 33, 1, 60, 6 + len(target)) + \
+            struct.pack(">HHH", 0, 5, self.port) + target
+        self.transport.sendto(data[:2] + struct.pack(">HHHHH", 0x8180, 1, 1, 0, 0) + data[12:] + answer, addr)
+
+
+class FakeQuery(asyncio.DatagramProtocol):
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        session = data[3:7]
+        if data[2] == 0x09:
+            self.transport.sendto(b"\x09" + session + b"9513307\x00", addr)
+        else:
+            info = b"plugins\x00Paper 1.16: WorldEdit; Essentials\x00map\x00world\x00numplayers\x001\x00" \
+                   b"maxplayers\x0020\x00\x00"
+            self.transport.sendto(b"\x00" + session + b"splitnum\x00\x80\x00" + info + b"\x01player_\x00\x00a\x00\x00",
+                                  addr)
+
+
+async def fake_server_list(reader, writer):
+    for _ in range(2):  # Handshake, then the status request.
+        await reader.readexactly(await minecraft.read_varint(reader))
+
+    response = {"version": {"name": "1.16.4", "protocol": 754},
+                "players": {"online": 1, "max": 20, "sample": [{"name": "a"}]},
+                "description": {"text": "§aHello ", "extra": [{"text": "World"}]},
+                "favicon": "data:image/png;base64," + base64.b64encode(b"PNG").decode()}
+    writer.write(minecraft.packet(0x00, minecraft.pack_string(json.dumps(response))))
+
+    ping = await reader.readexactly(await minecraft.read_varint(reader))
+    writer.write(minecraft.packet(0x01, ping[1:]))
+    await writer.drain()
+    writer.close()
+
+
+async def start_fakes(dns_host="127.0.0.1"):
+    loop = asyncio.get_event_loop()
+    server = await asyncio.start_server(fake_server_list, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    query, _ = await loop.create_datagram_endpoint(FakeQuery, local_addr=("127.0.0.1", port))
+    dns_transport, dns = await loop.create_datagram_endpoint(lambda: FakeDNS(port), local_addr=(dns_host, 0))
+    return server, query, dns_transport, dns, port
+
+
+def test_status_and_query_share_one_srv_lookup():
+    async def run():
+        server, query, dns_transport, dns, port = await start_fakes()
+        client = minecraft.MinecraftClient(nameserver=f"127.0.0.1:{dns_transport.get_extra_info('sockname')[1]}",
+                                           allow_private=True)
+        try:
+            target = await client.resolve("play.example")
+            assert target == ("127.0.0.1", port, "127.0.0.1")
+            return dns.requests, await asyncio.gather(client.status("play.example", target),
+                                                      client.full_stat("play.example", target))
+        finally:
+            server.close()
+            query.close()
+            dns_transport.close()
+
+    requests, (status, full) = asyncio.run(run())
+    assert requests == 1
+    assert (status.version, status.online, status.max, status.players) == ("1.16.4", 1, 20, ["a"])
+    assert status.motd == "Hello World"
+    assert status.favicon == b"PNG"
+    assert full.software == "Paper 1.16"
+    assert full.plugins == ["WorldEdit", "Essentials"]
+    assert full.players == ["a"]
+
+
+def test_srv_lookup_over_ipv6_nameserver():
+    if not socket.has_ipv6:
+        pytest.skip("IPv6 is not available")
+
+    async def run():
+        try:
+            server, query, dns_transport, dns, port = await start_fakes("::1")
+        except OSError:
+            pytest.skip("Cannot bind to ::1")
+        client = minecraft.MinecraftClient(nameserver=f"[::1]:{dns_transport.get_extra_info('sockname')[1]}",
+                                           allow_private=True)
+        try:
+            return await client.resolve("play.example"), port
+        finally:
+            server.close()
+            query.close()
+            dns_transport.close()
+
+    target, port = asyncio.run(run())
+    assert target == ("127.0.0.1", port, "127.0.0.1")
+
+
+def test_unreachable_server_raises_minecraft_error():
+    client = minecraft.MinecraftClient(connect_timeout=1, allow_private=True)
+    with pytest.raises(minecraft.MinecraftError) as error:
+        asyncio.run(client.status("127.0.0.1:1"))
+    assert error.value.stage == "connect"
+
+
+@pytest.mark.parametrize("address", ["localhost", "127.0.0.1:25565", "10.0.0.1", "192.168.1.5:25570", "172.16.0.1",
+                                     "169.254.169.254", "0.0.0.0", "[::1]:25565", "[fe80::1]:25565",
+                                     "[::ffff:127.0.0.1]:25565"])
+def test_private_addresses_are_refused(address):
+    client = minecraft.MinecraftClient()
+    with pytest.raises(minecraft.MinecraftError) as error:
+        asyncio.run(client.status(address))
+    assert error.value.stage == "resolve"
+
+
+def test_public_addresses_are_allowed():
+    assert minecraft.is_public("8.8.8.8")
+    assert minecraft.is_public("2606:4700:4700::1111")
+    assert not minecraft.is_public("::ffff:10.0.0.1")
+
+
+def test_oversized_packet_is_refused():
+    async def hostile(reader, writer):
+        for _ in range(2):
+            await reader.readexactly(await minecraft.read_varint(reader))
+        writer.write(minecraft.pack_varint(0x7FFFFFFF))  # Claims a 2 GiB status response.
+        await writer.drain()
+        await asyncio.sleep(1)
+        writer.close()
+
+    async def run():
+        server = await asyncio.start_server(hostile, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            await minecraft.MinecraftClient(allow_private=True).status(f"127.0.0.1:{port}")
+        finally:
+            server.close()
+
+    with pytest.raises(minecraft.MinecraftError) as error:
+        asyncio.run(run())
+    assert "byte packet" in error.value.message
@@ -0,0 +1,98 @@
+import asyncio
+from types import SimpleNamespace
+
+from minesoc.utils import nodes
+
+
+def stats(load=0.1, players=0, deficit=-1, nulled=0):
+    return SimpleNamespace(system_load=load, players=players, playing_players=players, frames_deficit=deficit,
+                           frames_nulled=nulled)
+
+
+def node(name, region, available=True, **kwargs):
+    return SimpleNamespace(name=name, region=region, available=available, stats=stats(**kwargs))
+
+
+class FakePlayer:
+    def __init__(self, guild_id, node, region=None):
+        self.guild_id = guild_id
+        self.node = node
+        self.queue = [f"track {i}" for i in range(3)]
+        self.data = {"region": region}
+        self.moves = []
+
+    def fetch(self, key):
+        return self.data.get(key)
+
+    async def change_node(self, node):
+        self.moves.append(node.name)
+        self.node = node
+
+
+def pool(node_list, players=()):
+    client = SimpleNamespace(node_manager=SimpleNamespace(nodes=node_list),
+                             players=SimpleNamespace(players={p.guild_id: p for p in players}))
+    bot = SimpleNamespace(logger=None, is_closed=lambda: False)
+    return nodes.NodePool(bot, client)
+
+
+def test_places_on_lowest_penalty():
+    busy, idle = node("busy", "eu", load=0.6, players=20), node("idle", "eu", load=0.05, players=1)
+    assert pool([busy, idle]).best().name == "idle"
+
+
+def test_frame_deficit_raises_penalty():
+    stuttering = node("stuttering", "eu", players=2, deficit=500)
+    smooth = node("smooth", "eu", players=5, deficit=0)
+    assert nodes.penalty(stuttering) > nodes.penalty(smooth)
+    assert pool([stuttering, smooth]).best().name == "smooth"
+
+
+def test_prefers_guild_region():
+    eu, us = node("eu-1", "eu", load=0.5), node("us-1", "us", load=0.0)
+    placement = pool([eu, us])
+    assert placement.best("europe").name == "eu-1"
+    assert placement.best("us-east").name == "us-1"
+    assert placement.best("japan").name == "us-1"  # No local node; least loaded overall.
+
+
+def test_counts_players_placed_since_last_stats():
+    a, b = node("a", "eu"), node("b", "eu")
+    players = [FakePlayer(i, a) for i in range(3)]
+    assert pool([a, b], players).best().name == "b"
+
+
+def test_skips_unhealthy_nodes():
+    down = node("down", "eu", available=False)
+    overloaded = node("overloaded", "eu", load=0.95)
+    dropping = node("dropping", "eu", players=10, deficit=20000)
+    fine = node("fine", "us", load=0.5, players=30)
+    placement = pool([down, overloaded, dropping, fine])
+
+    assert not placement.healthy(down)
+    assert not placement.healthy(overloaded)
+    assert not placement.healthy(dropping)
+    assert placement.best("europe").name == "fine"
+    assert pool([down, overloaded]).best() is None
+
+
+def test_rebalance_moves_players_and_keeps_queues():
+    sick, healthy = node("sick", "eu", load=0.97, players=8), node("healthy", "eu")
+    players = [FakePlayer(i, sick, "europe") for i in range(8)]
+    placement = pool([sick, healthy], players)
+
+    # Still available, so only a few move per check.
+    assert asyncio.run(placement.rebalance()) == placement.max_moves
+    sick.available = False
+    assert asyncio.run(placement.rebalance()) == 8 - placement.max_moves
+
+    assert all(player.node is healthy and player.moves == ["healthy"] for player in players)
+    assert all(player.queue == ["track 0", "track 1", "track 2"] for player in players)
+    assert placement.moved == 8
+
+
+def test_rebalance_keeps_players_when_nowhere_to_go():
+    sick = node("sick", "eu", available=False)
+    players = [FakePlayer(1, sick)]
+    assert asyncio.run(pool([sick], players).rebalance()) == 0
+    assert players[0].node is sick
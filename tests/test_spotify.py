@@ -0,0 +1,169 @@
+import asyncio
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from minesoc.utils.spotify import SpotifyClient, SpotifyError
+
+
+class FakeSpotify:
+    """A local stand-in for the accounts and Web API endpoints the client uses."""
+
+    def __init__(self, expires_in=3600, album_size=230):
+        self.expires_in = expires_in
+        self.album = [{"id": str(i), "name": f"track {i}"} for i in range(album_size)]
+        self.tokens_issued = 0
+        self.revoked = set()
+        self.fail = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+        self.app = web.Application()
+        self.app.router.add_post("/token", self.token)
+        self.app.router.add_get("/v1/albums/{id}/tracks", self.album_tracks)
+        self.app.router.add_get("/v1/playlists/{id}/tracks", self.playlist_tracks)
+        self.app.router.add_get("/v1/tracks/{id}", self.track)
+
+    async def token(self, request):
+        if request.headers.get("Authorization") is None:
+            return web.json_response({"error_description": "Missing credentials"}, status=400)
+        self.tokens_issued += 1
+        return web.json_response({"access_token": f"token-{self.tokens_issued}", "expires_in": self.expires_in})
+
+    def authorized(self, request):
+        token = request.headers.get("Authorization", "").replace("Bearer ", "")
+        return token.startswith("token-") and token not in self.revoked
+
+    async def page(self, request, items):
+        if not self.authorized(request):
+            return web.json_response({"error": {"status": 401, "message": "Invalid token"}}, status=401)
+
+        limit, offset = int(request.query["limit"]), int(request.query["offset"])
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            # Later pages answer first, so the client has to put them back in order itself.
+            await asyncio.sleep(0.05 * max(len(items) - offset, 0) / len(items))
+        finally:
+            self.in_flight -= 1
+        return web.json_response({"items": items[offset:offset + limit], "total": len(items)})
+
+    async def album_tracks(self, request):
+        return await self.page(request, self.album)
+
+    async def playlist_tracks(self, request):
+        items = [{"track": track} for track in self.album] + [{"track": None}]
+        return await self.page(request, items)
+
+    async def track(self, request):
+        track_id = request.match_info["id"]
+        failure = self.fail.get(track_id)
+        if failure:
+            status, headers = failure.pop(0)
+            return web.json_response({"error": {"status": status, "message": "Failure"}}, status=status,
+                                     headers=headers)
+        if not self.authorized(request):
+            return web.json_response({"error": {"status": 401, "message": "Invalid token"}}, status=401)
+        if track_id == "missing":
+            return web.json_response({"error": {"status": 404, "message": "non existing id"}}, status=404)
+        return web.json_response({"id": track_id, "name": f"track {track_id}"})
+
+
+def run(fake, test):
+    async def main():
+        runner = web.AppRunner(fake.app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        try:
+            async with aiohttp.ClientSession() as session:
+                client = SpotifyClient(session, "id", "secret", concurrency=4, api_url=f"http://127.0.0.1:{port}/v1",
+                                       token_url=f"http://127.0.0.1:{port}/token")
+                return await test(client)
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(main())
+
+
+def test_token_is_cached_until_it_expires():
+    fake = FakeSpotify(expires_in=3600)
+
+    async def test(client):
+        await asyncio.gather(*(client.track(str(i)) for i in range(5)))
+        await client.track("5")
+
+    run(fake, test)
+    assert fake.tokens_issued == 1
+
+
+def test_token_is_renewed_when_close_to_expiry():
+    fake = FakeSpotify(expires_in=60)  # Already inside the minute of slack the client keeps.
+
+    async def test(client):
+        await client.track("1")
+        await client.track("2")
+
+    run(fake, test)
+    assert fake.tokens_issued == 2
+
+
+def test_pages_are_fetched_concurrently_and_kept_in_order():
+    fake = FakeSpotify(album_size=230)
+
+    async def test(client):
+        return await client.album_tracks("album"), await client.playlist_tracks("playlist")
+
+    album, playlist = run(fake, test)
+    assert [track["id"] for track in album] == [str(i) for i in range(230)]
+    assert [track["id"] for track in playlist] == [str(i) for i in range(230)]  # The null track is dropped.
+    assert 1 < fake.max_in_flight <= 4
+
+
+def test_reauthenticates_after_401():
+    fake = FakeSpotify()
+
+    async def test(client):
+        await client.track("1")
+        fake.revoked.add("token-1")
+        return await client.track("2")
+
+    assert run(fake, test)["id"] == "2"
+    assert fake.tokens_issued == 2
+
+
+def test_retries_after_429_with_retry_after():
+    fake = FakeSpotify()
+    fake.fail["1"] = [(429, {"Retry-After": "0"}), (429, {"Retry-After": "0"})]
+
+    async def test(client):
+        return await client.track("1")
+
+    assert run(fake, test)["id"] == "1"
+    assert fake.fail["1"] == []
+
+
+def test_other_failures_raise_spotify_error():
+    fake = FakeSpotify()
+
+    async def test(client):
+        await client.track("missing")
+
+    with pytest.raises(SpotifyError) as error:
+        run(fake, test)
+    assert error.value.status == 404
+    assert error.value.message == "non existing id"
+
+
+def test_gives_up_after_repeated_429():
+    fake = FakeSpotify()
+    fake.fail["1"] = [(429, {"Retry-After": "0"})] * 3
+
+    async def test(client):
+        await client.track("1")
+
+    with pytest.raises(SpotifyError) as error:
+        run(fake, test)
+    assert error.value.status == 429
@@ -0,0 +1,63 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from minesoc.utils import xp
+
+
+class FakeDB:
+    def __init__(self):
+        self.batches = []
+        self.fail = False
+
+    async def fetchrow(self, query, *args):
+        return None
+
+    async def executemany(self, query, rows):
+        if self.fail:
+            raise ConnectionError("database went away")
+        self.batches.append(rows)
+
+
+def make_bot():
+    return SimpleNamespace(db=FakeDB(), loop=asyncio.get_event_loop(), xp_gain=lambda: 10,
+                           leaderboards=SimpleNamespace(update=lambda *args: None))
+
+
+def test_flush_one_guild_only_writes_its_members():
+    async def run():
+        bot = make_bot()
+        acc = xp.XPAccumulator(bot)
+        for guild, user in [(1, 10), (1, 11), (2, 20)]:
+            await acc.award(guild, user)
+        assert acc.dirty == {1: {10, 11}, 2: {20}}
+
+        assert await acc.flush(1) == 2
+        assert sorted(row[:2] for row in bot.db.batches[0]) == [(10, 1), (11, 1)]
+        assert acc.dirty == {2: {20}}
+        assert acc.entries[(2, 20)].dirty
+
+        assert await acc.flush(1) == 0
+        assert await acc.flush() == 1
+        assert acc.dirty == {}
+
+    asyncio.run(run())
+
+
+def test_failed_flush_keeps_members_dirty():
+    async def run():
+        bot = make_bot()
+        acc = xp.XPAccumulator(bot)
+        await acc.award(1, 10)
+        bot.db.fail = True
+
+        with pytest.raises(ConnectionError):
+            await acc.flush(1)
+        assert acc.dirty == {1: {10}}
+        assert acc.entries[(1, 10)].dirty
+
+        bot.db.fail = False
+        assert await acc.flush() == 1
+
+    asyncio.run(run())